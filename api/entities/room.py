@@ -22,12 +22,17 @@ class Room(Base):
     """備考"""
 
     # リレーション
+    #   既定では読み込まず、意図しない遅延読み込みは例外にする
+    #   （用途ごとの読み込み方は RoomRepo の読み込みプロファイルで指定）
     members = relationship(
-        "RoomMember", back_populates="room", lazy="joined", cascade="all, delete-orphan"
+        "RoomMember", back_populates="room", lazy="raise", cascade="all, delete-orphan"
     )
+    #   メッセージは履歴APIでページ取得するため読み込まない
+    #   （ルーム削除時は RoomRepo.delete で一括削除してから削除する）
     messages = relationship(
         "RoomMessage",
         back_populates="room",
-        lazy="joined",
+        lazy="raise",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, Unicode
+from sqlalchemy import ForeignKey, Index, Integer, String, Unicode
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from api.entities.base import Base
@@ -11,6 +11,17 @@ from api.entities.base import Base
 class RoomMessage(Base):
 
     __tablename__ = "t_room_message"
+    __table_args__ = (
+        # 履歴のページング（room_id で絞り込み id 順に取得）用
+        Index("ix_t_room_message_room_id_id", "room_id", "id"),
+        # 再送されたメッセージの重複登録防止用
+        Index(
+            "ux_t_room_message_user_id_client_msg_id",
+            "user_id",
+            "client_msg_id",
+            unique=True,
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     """id（Key）"""
@@ -28,6 +39,9 @@ class RoomMessage(Base):
     message: Mapped[str] = mapped_column(Unicode(1000), nullable=False)
     """メッセージ"""
 
+    client_msg_id: Mapped[str] = mapped_column(String(64), nullable=True)
+    """クライアント側で採番したメッセージID（再送時の重複判定用）"""
+
     # リレーション
     room = relationship("Room", back_populates="messages")
     user = relationship("User", lazy="joined")
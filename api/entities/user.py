@@ -27,6 +27,11 @@ class User(Base):
     authority_code: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     """権限コード"""
 
+    version: Mapped[int] = mapped_column(
+        Integer, default=1, server_default="1", nullable=False
+    )
+    """バージョン（更新のたびに加算し、ログイン中のセッションを再認証させる）"""
+
     # 汎用マスタの権限コードへリレーション
     authority = relationship(
         "General",
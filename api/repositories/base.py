@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional, TypeVar
+
+from sqlalchemy.orm import Session
+
+from api.std import sql
+
+"""
+    repositoriesの基底クラス
+"""
+
+T = TypeVar("T")
+
+
+class BaseRepo:
+    """
+    BaseRepo
+    セッションの受け渡しを共通化した基底クラス
+        ・リクエスト単位のセッション（sql.get_session）を指定した場合はそれを使用し、
+          コミットは依存関係の終了時にまとめて行う（各処理ではflushのみ）
+        ・未指定の場合は処理ごとにセッションを作成してコミットする
+    """
+
+    def __init__(self, session: Optional[Session] = None):
+        self.session = session
+
+    @contextmanager
+    def _session(self) -> Iterator[Session]:
+        """
+        処理で使用するセッションを取得
+        """
+        if self.session is not None:
+            yield self.session
+        else:
+            with sql.Session() as session:
+                yield session
+
+    def _commit(self, session: Session):
+        """
+        変更を反映（リクエスト単位のセッションではflushのみ行い、IDなどを採番させる）
+        """
+        if self.session is not None:
+            session.flush()
+        else:
+            session.commit()
+
+    def detach(self, entity: T) -> T:
+        """
+        取得したエンティティをセッションから切り離す
+        画面の入力値で書き換える場合に使用し、更新処理を呼ぶまでDBへ反映させない
+            Args:
+                entity: 切り離すエンティティ
+            Returns:
+                切り離したエンティティ
+        """
+        if self.session is not None and entity in self.session:
+            self.session.expunge(entity)
+        return entity
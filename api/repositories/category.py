@@ -3,10 +3,11 @@ from typing import Sequence
 from sqlalchemy import and_, select
 
 from api.entities.category import Category
+from api.repositories.base import BaseRepo
 from api.std import sql
 
 
-class CategoryRepo:
+class CategoryRepo(BaseRepo):
     """
     CategoryRepo
     カテゴリマスタへのSQL処理を束ねたクラス
@@ -19,9 +20,33 @@ class CategoryRepo:
             Returns:
                 Sequence: 取得したカテゴリのリスト
         """
-        with sql.Session() as session:
-            return session.scalars(
-                select(Category)
-                .where(and_(Category.del_flag == False, Category.maintenance_flag == True))
-                .order_by(Category.sort_key)
-            ).all()
+        with self._session() as session:
+            return session.scalars(_list_query()).all()
+
+
+class AsyncCategoryRepo:
+    """
+    AsyncCategoryRepo
+    CategoryRepo の非同期版
+    """
+
+    async def list(self) -> Sequence[Category]:
+        """
+        カテゴリのリストを取得
+            Args:
+            Returns:
+                Sequence: 取得したカテゴリのリスト
+        """
+        async with sql.AsyncSession() as session:
+            return (await session.scalars(_list_query())).all()
+
+
+def _list_query():
+    """
+    メンテナンス可能なカテゴリの検索クエリ
+    """
+    return (
+        select(Category)
+        .where(and_(Category.del_flag == False, Category.maintenance_flag == True))
+        .order_by(Category.sort_key)
+    )
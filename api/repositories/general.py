@@ -4,10 +4,22 @@ from sqlalchemy import and_, func, select
 
 from api.entities.category import Category
 from api.entities.general import General
+from api.repositories.base import BaseRepo
 from api.std import sql
+from api.std.paging import SeekKey, fetch_page, fetch_page_async, order_by
+from api.std.routing import read_only
 
+# 一覧の並び順（カテゴリ名、削除フラグ、ソートキー、主キー順）
+LIST_KEYS = (
+    SeekKey(Category.display_name, getter=lambda g: g.r_category.display_name),
+    SeekKey(General.del_flag),
+    SeekKey(General.sort_key),
+    SeekKey(General.category),
+    SeekKey(General.code),
+)
 
-class GeneralRepo:
+
+class GeneralRepo(BaseRepo):
     """
     GeneralRepo
     汎用マスタへのSQL処理を束ねたクラス
@@ -21,23 +33,17 @@ class GeneralRepo:
             Returns:
                 Sequence: 指定したコード情報のリスト
         """
-        with sql.Session() as session:
-            return (
-                session.scalars(
-                    select(General)
-                    .where(and_(General.category == category, General.del_flag == False))
-                    .order_by(General.sort_key)
-                )
-                .unique()
-                .all()
-            )
+        with self._session() as session:
+            return session.scalars(_find_query(category)).unique().all()
 
+    @read_only
     def find_list(
         self,
         category: Optional[str] = None,
         code_value: Optional[str] = None,
         offset: int = 0,
         limit: int = 10,
+        cursor: Optional[str] = None,
     ) -> Tuple[Sequence[General], int]:
         """
         指定した条件に合致する汎用マスタ情報を取得
@@ -46,36 +52,17 @@ class GeneralRepo:
                 code_value: 名称（部分一致）
                 offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
                 limit: 何件取得するか指定
+                cursor: 前後のページのカーソル（指定時は offset を使用しない）
             Returns:
                 Sequence: ヒットした汎用マスタ情報のリスト
                 int: ヒットした件数
         """
-        with sql.Session() as session:
-            query = select(General)
-            query = query.outerjoin(Category)
-            query = query.where(Category.maintenance_flag == True)
-
-            if category:
-                query = query.where(General.category == category)
-            if code_value:
-                query = query.where(General.code_value.contains(code_value))
-
-            # カテゴリ、ソートキー、削除フラグで並び替え
-            query = query.order_by(
-                Category.display_name, General.del_flag, General.sort_key
-            )
-
-            # レコード件数取得
-            count_query = select(func.count()).select_from(query.subquery())
-            rec_count = session.execute(count_query).scalar() or 0
-
-            # 検索処理時のみオフセット指定（Excelダウンロード時は不要）
-            if offset >= 0:
-                query = query.offset(offset).limit(limit)
-
-            general_list = session.scalars(query).unique().all()
+        with self._session() as session:
+            query = _find_list_query(category, code_value)
 
-            return general_list, rec_count
+            # ページ分のデータとレコード件数を1回のSQLで取得
+            # （Excelダウンロード時はオフセットに-1を指定して全件取得）
+            return fetch_page(session, query, offset, limit, LIST_KEYS, cursor)
 
     def find_by_code(self, code: int, category: str) -> General:
         """
@@ -86,16 +73,8 @@ class GeneralRepo:
             Returns:
                 General: 取得した汎用マスタ情報
         """
-        with sql.Session() as session:
-            return (
-                session.scalars(
-                    select(General).where(
-                        General.code == code, General.category == category
-                    )
-                )
-                .unique()
-                .one()
-            )
+        with self._session() as session:
+            return session.scalars(_find_by_code_query(code, category)).unique().one()
 
     def create(self, general: General) -> int:
         """
@@ -106,15 +85,10 @@ class GeneralRepo:
                 int: 登録したレコードのID
         """
 
-        with sql.Session() as session:
-            max_value = (
-                session.query(func.max(General.code) + 1)
-                .filter(General.category == general.category)
-                .scalar()
-            )
-            general.code = max_value
+        with self._session() as session:
+            general.code = session.scalar(_next_code_query(general.category))
             session.add(general)
-            session.commit()
+            self._commit(session)
             return general.code
 
     def update(self, general: General):
@@ -125,24 +99,14 @@ class GeneralRepo:
             Returns:
 
         """
-        with sql.Session() as session:
+        with self._session() as session:
             current_general = (
-                session.scalars(
-                    select(General).where(
-                        General.code == general.code,
-                        General.category == general.category,
-                    )
-                )
+                session.scalars(_find_by_code_query(general.code, general.category))
                 .unique()
                 .one()
             )
-            current_general.category = general.category
-            current_general.code = general.code
-            current_general.code_value = general.code_value
-            current_general.sort_key = general.sort_key
-            current_general.remarks = general.remarks
-            current_general.del_flag = general.del_flag
-            session.commit()
+            _copy_general(general, current_general)
+            self._commit(session)
 
     def duplicate_check(self, general: General) -> bool:
         """
@@ -152,11 +116,149 @@ class GeneralRepo:
             Returns:
                 bool: 重複データが0件の場合はtrue
         """
-        with sql.Session() as session:
-            query = select(func.count()).where(
-                General.category == general.category,
-                General.code_value == general.code_value,
-                General.code != general.code,
+        with self._session() as session:
+            result = session.execute(_duplicate_count_query(general)).scalar()
+        return result == 0
+
+
+class AsyncGeneralRepo:
+    """
+    AsyncGeneralRepo
+    GeneralRepo の非同期版
+    """
+
+    async def find(self, category: str) -> Sequence[General]:
+        """
+        指定したカテゴリのリストを取得（GeneralRepo.find を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (await session.scalars(_find_query(category))).unique().all()
+
+    @read_only
+    async def find_list(
+        self,
+        category: Optional[str] = None,
+        code_value: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Sequence[General], int]:
+        """
+        指定した条件に合致する汎用マスタ情報を取得（GeneralRepo.find_list を参照）
+        """
+        async with sql.AsyncSession() as session:
+            query = _find_list_query(category, code_value)
+            return await fetch_page_async(
+                session, query, offset, limit, LIST_KEYS, cursor
+            )
+
+    async def find_by_code(self, code: int, category: str) -> General:
+        """
+        指定したcode,categoryの汎用マスタ情報を取得（GeneralRepo.find_by_code を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (
+                (await session.scalars(_find_by_code_query(code, category)))
+                .unique()
+                .one()
             )
-            result = session.execute(query).scalar()
+
+    async def create(self, general: General) -> int:
+        """
+        機種情報を作成（GeneralRepo.create を参照）
+        """
+        async with sql.AsyncSession() as session:
+            general.code = await session.scalar(_next_code_query(general.category))
+            session.add(general)
+            await session.commit()
+            return general.code
+
+    async def update(self, general: General):
+        """
+        機種情報を更新（GeneralRepo.update を参照）
+        """
+        async with sql.AsyncSession() as session:
+            current_general = (
+                (
+                    await session.scalars(
+                        _find_by_code_query(general.code, general.category)
+                    )
+                )
+                .unique()
+                .one()
+            )
+            _copy_general(general, current_general)
+            await session.commit()
+
+    async def duplicate_check(self, general: General) -> bool:
+        """
+        同カテゴリ内の同一の名称の有無のチェック（GeneralRepo.duplicate_check を参照）
+        """
+        async with sql.AsyncSession() as session:
+            result = (await session.execute(_duplicate_count_query(general))).scalar()
         return result == 0
+
+
+def _find_query(category: str):
+    """
+    指定したカテゴリの検索クエリ
+    """
+    return (
+        select(General)
+        .where(and_(General.category == category, General.del_flag == False))
+        .order_by(General.sort_key)
+    )
+
+
+def _find_list_query(category: Optional[str], code_value: Optional[str]):
+    """
+    汎用マスタ一覧の検索クエリ
+    """
+    query = select(General)
+    query = query.outerjoin(Category)
+    query = query.where(Category.maintenance_flag == True)
+
+    if category:
+        query = query.where(General.category == category)
+    if code_value:
+        query = query.where(General.code_value.contains(code_value))
+
+    # カテゴリ、ソートキー、削除フラグで並び替え
+    return query.order_by(*order_by(LIST_KEYS))
+
+
+def _find_by_code_query(code: int, category: str):
+    """
+    指定したcode,categoryの検索クエリ
+    """
+    return select(General).where(General.code == code, General.category == category)
+
+
+def _next_code_query(category: str):
+    """
+    指定したカテゴリの次のコード（最大値+1）を取得するクエリ
+    """
+    return select(func.max(General.code) + 1).where(General.category == category)
+
+
+def _duplicate_count_query(general: General):
+    """
+    同カテゴリ内の同一名称の件数を取得するクエリ
+    """
+    return select(func.count()).where(
+        General.category == general.category,
+        General.code_value == general.code_value,
+        General.code != general.code,
+    )
+
+
+def _copy_general(source: General, target: General):
+    """
+    更新対象の項目をコピー
+    """
+    target.category = source.category
+    target.code = source.code
+    target.code_value = source.code_value
+    target.sort_key = source.sort_key
+    target.remarks = source.remarks
+    target.del_flag = source.del_flag
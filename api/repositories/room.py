@@ -1,27 +1,52 @@
-from typing import Optional, Sequence, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import and_, asc, desc, func, select
+from sqlalchemy import Row, and_, asc, delete, desc, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, raiseload, selectinload
 
 from api.entities.room import Room
 from api.entities.room_member import RoomMember
 from api.entities.room_message import RoomMessage
 from api.entities.user import User
-from api.repositories.user import UserRepo
+from api.repositories.base import BaseRepo
 from api.std import sql
+from api.std.paging import SeekKey, fetch_page, fetch_page_async, order_by
+from api.std.routing import mark_writes, read_only
 
+# ルームの読み込みプロファイル（用途ごとのリレーションの読み込み方）
+#   指定していないリレーションは読み込まず、参照した場合は例外にする
+#   入力画面・更新：メンバー（とそのユーザ）を別クエリで一括取得
+LOAD_FORM = (
+    selectinload(Room.members).joinedload(RoomMember.user),
+    raiseload("*"),
+)
+#   一覧：ルーム名未設定時にメンバー名を表示するため、メンバーとそのユーザを取得
+#   （メッセージは読み込まないため、一覧の件数はチャットの量に依存しない）
+LOAD_LIST = LOAD_FORM
+#   チャット画面：ルームの項目のみ（メッセージは履歴APIでページ取得）
+LOAD_CHAT = (raiseload("*"),)
 
-class RoomRepo:
+# 一覧の並び順（更新日の新しい順、同日時はIDの大きい順）
+LIST_KEYS = (
+    SeekKey(Room.update_date, descending=True),
+    SeekKey(Room.id, descending=True),
+)
+
+
+class RoomRepo(BaseRepo):
     """
     RoomRepo
     チャットルーム関連のSQL処理を束ねたクラス
     """
 
+    @read_only
     def find_list(
         self,
         room_name: Optional[str] = None,
         member_id: Optional[id] = None,
         offset: int = 0,
         limit: int = 10,
+        cursor: Optional[str] = None,
     ) -> Tuple[Sequence[Room], int]:
         """
         指定した条件に合致するルーム情報を取得
@@ -30,44 +55,28 @@ class RoomRepo:
                 member_name: メンバー名（部分一致）
                 offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
                 limit: 何件取得するか指定
+                cursor: 前後のページのカーソル（指定時は offset を使用しない）
             Returns:
                 Sequence: ヒットしたルーム情報のリスト
                 int: ヒットした件数
         """
-        with sql.Session() as session:
-            query = select(Room)
-            query = query.where(Room.del_flag == False)
-
-            if room_name:
-                query = query.where(Room.room_name.contains(room_name))
-            if member_id:
-                query = query.where(Room.members.any(RoomMember.user_id == member_id))
-
-            # 更新日で並び替え
-            query = query.order_by(desc(Room.update_date))
-
-            # レコード件数取得
-            count_query = select(func.count()).select_from(query.subquery())
-            rec_count = session.execute(count_query).scalar() or 0
+        with self._session() as session:
+            query = _find_list_query(room_name, member_id).options(*LOAD_LIST)
 
-            # 検索処理時のみオフセット指定（Excelダウンロード時は不要）
-            if offset >= 0:
-                query = query.offset(offset).limit(limit)
+            # ページ分のデータとレコード件数を1回のSQLで取得
+            return fetch_page(session, query, offset, limit, LIST_KEYS, cursor)
 
-            room_list = session.scalars(query).unique().all()
-
-            return room_list, rec_count
-
-    def find_by_id(self, id: int) -> Room:
+    def find_by_id(self, id: int, load: Tuple = LOAD_FORM) -> Room:
         """
         指定したidのルーム情報を取得
             Args:
                 id: Room のID
+                load: 読み込みプロファイル（LOAD_FORM, LOAD_CHAT など）
             Returns:
                 Room: 取得したルーム情報
         """
-        with sql.Session() as session:
-            return session.scalars(select(Room).where(Room.id == id)).unique().one()
+        with self._session() as session:
+            return session.scalars(_find_by_id_query(id, load)).one()
 
     def find_member_by_user_id(self, room_id: int, user_id) -> Room:
         """
@@ -78,19 +87,11 @@ class RoomRepo:
             Returns:
                 Room: 取得したメンバ情報
         """
-        with sql.Session() as session:
-            return (
-                session.scalars(
-                    select(RoomMember).where(
-                        and_(
-                            RoomMember.room_id == room_id, RoomMember.user_id == user_id
-                        )
-                    )
-                )
-                .unique()
-                .first()
-            )
+        with self._session() as session:
+            query = _find_member_query(room_id, user_id)
+            return session.scalars(query).unique().first()
 
+    @read_only
     def find_member_in_target_user(self, member_id: int) -> Sequence[User]:
         """
         指定したユーザIDが含まれるルームメンバー情報取得
@@ -99,47 +100,49 @@ class RoomRepo:
                 Sequence: ヒットしたメンバのリスト
         """
 
-        with sql.Session() as session:
-            query = select(User).distinct()
-            query = query.join(RoomMember, RoomMember.user_id == User.id)
-            query = query.where(
-                RoomMember.room_id.in_(
-                    select(RoomMember.room_id).where(RoomMember.user_id == member_id)
-                )
-            )
-
-            # メールアドレスで並び替え
-            query = query.order_by(asc(User.mail_address))
-
+        with self._session() as session:
+            query = _member_in_target_user_query(member_id)
             return session.scalars(query).unique().all()
 
+    @read_only
+    def find_messages(
+        self,
+        room_id: int,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[Sequence[Row], bool]:
+        """
+        指定したルームのメッセージ履歴をID基準（keyset）でページング取得
+            Args:
+                room_id: Room のID
+                before_id: 指定したIDより前（古い）のメッセージを取得
+                after_id: 指定したIDより後（新しい）のメッセージを取得
+                limit: 何件取得するか指定
+                ※ before_id, after_id とも未指定の場合は最新のメッセージを取得
+            Returns:
+                Sequence: メッセージのリスト（ID昇順）
+                bool: 取得範囲の先（古い方または新しい方）にまだメッセージがあるか
+        """
+        with self._session() as session:
+            query = _find_messages_query(room_id, before_id, after_id, limit)
+            rows = session.execute(query).all()
+            return _to_message_page(rows, after_id, limit)
+
     def create(self, room: Room, members: list) -> int:
         """
         ルーム情報を作成
             Args:
                 room: 登録対象のルーム情報クラス
-                members: 登録するメンバ
+                members: 登録するメンバ（メールアドレス）
             Returns:
                 int: 登録したレコードのID
         """
-        with sql.Session() as session:
+        with self._session() as session:
             session.add(room)
-
-            user_repo = UserRepo()
-            for member in members:
-                user = user_repo.find_by_address(member)
-                if user:
-                    room.members.append(RoomMember(user_id=user.id))
-
-                else:
-                    new_user = User()
-                    new_user.mail_address = member
-                    new_user.user_name = member
-                    new_user.hashed_password = member
-                    new_id = user_repo.create(new_user)
-                    room.members.append(RoomMember(user_id=new_id))
-
-            session.commit()
+            session.flush()
+            _sync_members(session, room, members)
+            self._commit(session)
             assert room.id is not None
             return room.id
 
@@ -148,48 +151,17 @@ class RoomRepo:
         ルーム情報を更新
             Args:
                 room: 更新対象のルーム情報クラス
-                members: 登録するメンバ
+                members: 登録するメンバ（メールアドレス）
             Returns:
 
         """
-        with sql.Session() as session:
-            current_room = (
-                session.scalars(select(Room).where(Room.id == room.id)).unique().one()
-            )
+        with self._session() as session:
+            # メンバーは読み込まずに差分だけを反映するため、ルームの項目のみ取得
+            current_room = session.scalars(_find_by_id_query(room.id, LOAD_CHAT)).one()
             current_room.room_name = room.room_name
             current_room.remarks = room.remarks
-
-            # --- 既存のメンバアドレス情報を取得 ---
-            user_repo = UserRepo()
-            existing_members = []
-            for member in current_room.members:
-                user = user_repo.find_by_id(member.user_id)
-                existing_members.append(user.mail_address)
-
-            # --- 削除対象（既存にしかいない）---
-            for member_addr in set(existing_members) - set(new_members):
-                user = user_repo.find_by_address(member_addr)
-                # 現在の Room.members から user_id が一致するオブジェクトを取得
-                member_obj = next(
-                    (m for m in current_room.members if m.user_id == user.id), None
-                )
-                if member_obj:
-                    current_room.members.remove(member_obj)
-
-            # --- 追加対象（新規にしかいない）---
-            for member_addr in set(new_members) - set(existing_members):
-                user = user_repo.find_by_address(member_addr)
-                if user:
-                    current_room.members.append(RoomMember(user_id=user.id))
-                else:
-                    new_user = User()
-                    new_user.mail_address = member_addr
-                    new_user.user_name = member_addr
-                    new_user.hashed_password = member_addr
-                    new_id = user_repo.create(new_user)
-                    current_room.members.append(RoomMember(user_id=new_id))
-
-            session.commit()
+            _sync_members(session, current_room, new_members)
+            self._commit(session)
 
     def delete(self, room: Room):
         """
@@ -199,21 +171,314 @@ class RoomRepo:
             Returns:
 
         """
-        with sql.Session() as session:
-            current_room = (
-                session.scalars(select(Room).where(Room.id == room.id)).unique().one()
-            )
+        with self._session() as session:
+            # メッセージは読み込まずに一括削除する
+            session.execute(_delete_messages_stmt(room.id))
+            current_room = session.scalars(_find_by_id_query(room.id)).one()
             session.delete(current_room)
-            session.commit()
+            self._commit(session)
+
 
-    def entry_message(self, room_message: RoomMessage):
+class AsyncRoomRepo:
+    """
+    AsyncRoomRepo
+    RoomRepo の非同期版
+    """
+
+    @read_only
+    async def find_list(
+        self,
+        room_name: Optional[str] = None,
+        member_id: Optional[id] = None,
+        offset: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Sequence[Room], int]:
         """
-        ルーム情報を作成
+        指定した条件に合致するルーム情報を取得（RoomRepo.find_list を参照）
+        """
+        async with sql.AsyncSession() as session:
+            query = _find_list_query(room_name, member_id).options(*LOAD_LIST)
+            return await fetch_page_async(
+                session, query, offset, limit, LIST_KEYS, cursor
+            )
+
+    async def find_by_id(self, id: int, load: Tuple = LOAD_FORM) -> Room:
+        """
+        指定したidのルーム情報を取得（RoomRepo.find_by_id を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (await session.scalars(_find_by_id_query(id, load))).one()
+
+    async def find_member_by_user_id(self, room_id: int, user_id) -> RoomMember:
+        """
+        指定したidのメンバ情報を取得（RoomRepo.find_member_by_user_id を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (
+                (await session.scalars(_find_member_query(room_id, user_id)))
+                .unique()
+                .first()
+            )
+
+    @read_only
+    async def find_member_in_target_user(self, member_id: int) -> Sequence[User]:
+        """
+        指定したユーザIDが含まれるルームメンバー情報取得
+        （RoomRepo.find_member_in_target_user を参照）
+        """
+        async with sql.AsyncSession() as session:
+            query = _member_in_target_user_query(member_id)
+            return (await session.scalars(query)).unique().all()
+
+    @read_only
+    async def find_messages(
+        self,
+        room_id: int,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[Sequence[Row], bool]:
+        """
+        指定したルームのメッセージ履歴をページング取得（RoomRepo.find_messages を参照）
+        """
+        async with sql.AsyncSession() as session:
+            query = _find_messages_query(room_id, before_id, after_id, limit)
+            rows = (await session.execute(query)).all()
+            return _to_message_page(rows, after_id, limit)
+
+    async def create(self, room: Room, members: list) -> int:
+        """
+        ルーム情報を作成（RoomRepo.create を参照）
+        """
+        async with sql.AsyncSession() as session:
+            session.add(room)
+            await session.flush()
+            await session.run_sync(_sync_members, room, members)
+            await session.commit()
+            assert room.id is not None
+            return room.id
+
+    async def update(self, room: Room, new_members: list):
+        """
+        ルーム情報を更新（RoomRepo.update を参照）
+        """
+        async with sql.AsyncSession() as session:
+            current_room = (
+                await session.scalars(_find_by_id_query(room.id, LOAD_CHAT))
+            ).one()
+            current_room.room_name = room.room_name
+            current_room.remarks = room.remarks
+            await session.run_sync(_sync_members, current_room, new_members)
+            await session.commit()
+
+    async def delete(self, room: Room):
+        """
+        ルーム情報を削除（RoomRepo.delete を参照）
+        """
+        async with sql.AsyncSession() as session:
+            await session.execute(_delete_messages_stmt(room.id))
+            current_room = (await session.scalars(_find_by_id_query(room.id))).one()
+            await session.delete(current_room)
+            await session.commit()
+
+    async def entry_messages(self, room_messages: List[Dict]) -> Sequence[Row]:
+        """
+        メッセージを一括登録（複数行INSERTを1回で実行）
+        同じユーザ・クライアントメッセージIDのメッセージが登録済みの場合は登録しない
             Args:
-                room_message: メッセージ情報
+                room_messages: メッセージ情報（room_id, user_id, message, client_msg_id）の辞書リスト
             Returns:
-
+                Sequence: 登録したメッセージの id, create_date, user_id, client_msg_id
+                          （重複で登録しなかったメッセージは含まない）
         """
-        with sql.Session() as session:
-            session.add(room_message)
-            session.commit()
+        if not room_messages:
+            return []
+
+        async with sql.AsyncSession() as session:
+            rows = (await session.execute(_entry_messages_stmt(), room_messages)).all()
+            await session.commit()
+            return rows
+
+
+def _find_list_query(room_name: Optional[str], member_id: Optional[int]):
+    """
+    ルーム一覧の検索クエリ
+    """
+    query = select(Room)
+    query = query.where(Room.del_flag == False)
+
+    if room_name:
+        query = query.where(Room.room_name.contains(room_name))
+    if member_id:
+        query = query.where(Room.members.any(RoomMember.user_id == member_id))
+
+    # 更新日で並び替え
+    return query.order_by(*order_by(LIST_KEYS))
+
+
+def _find_by_id_query(id: int, load: Tuple = LOAD_FORM):
+    """
+    指定したidのルームの取得クエリ
+    """
+    return select(Room).options(*load).where(Room.id == id)
+
+
+def _delete_messages_stmt(room_id: int):
+    """
+    指定したルームのメッセージの一括削除文
+    """
+    return delete(RoomMessage).where(RoomMessage.room_id == room_id)
+
+
+def _sync_members(session: Session, room: Room, addresses: Sequence[str]):
+    """
+    ルームのメンバーを指定したメールアドレスのユーザに揃える
+    メンバー数によらず一定回数のSQLで反映する
+        ・アドレスからユーザIDを一括取得し、未登録のアドレスはユーザを一括登録
+        ・現在のメンバーとの差分を一括削除・一括登録
+        Args:
+            session: 実行するセッション（同じトランザクションで反映する）
+            room: 対象のルーム（登録済みであること）
+            addresses: メンバーのメールアドレス
+    """
+    connection = session.connection()
+    addresses = sorted(set(addresses))
+    user_ids = _find_user_ids(session, addresses)
+
+    # 未登録のアドレスは、アドレスを名前・パスワードとしてユーザ登録
+    # （同時に登録された場合は読み飛ばして、登録済みのユーザを使用する）
+    missing = [address for address in addresses if address not in user_ids]
+    if missing:
+        sql.upsert_many(
+            User.__table__,
+            [
+                {"mail_address": a, "user_name": a, "hashed_password": a}
+                for a in missing
+            ],
+            ["mail_address"],
+            connection=connection,
+        )
+        user_ids.update(_find_user_ids(session, missing))
+
+    current_ids = set(
+        session.scalars(
+            select(RoomMember.user_id).where(RoomMember.room_id == room.id)
+        ).all()
+    )
+    new_ids = set(user_ids.values())
+
+    removed_ids = current_ids - new_ids
+    if removed_ids:
+        session.execute(
+            delete(RoomMember).where(
+                RoomMember.room_id == room.id, RoomMember.user_id.in_(removed_ids)
+            )
+        )
+    added_ids = new_ids - current_ids
+    if added_ids:
+        sql.insert_many(
+            RoomMember.__table__,
+            [{"room_id": room.id, "user_id": user_id} for user_id in sorted(added_ids)],
+            returning=None,
+            connection=connection,
+        )
+
+    # ORMを介さずに更新したため、以降の参照はプライマリから読み込み直す
+    mark_writes(session)
+    session.expire(room, ["members"])
+
+
+def _find_user_ids(session: Session, addresses: Sequence[str]) -> Dict[str, int]:
+    """
+    メールアドレスに対応するユーザIDを一括取得
+    """
+    if not addresses:
+        return {}
+    query = select(User.mail_address, User.id).where(User.mail_address.in_(addresses))
+    return {address: user_id for address, user_id in session.execute(query)}
+
+
+def _find_member_query(room_id: int, user_id):
+    """
+    指定したルーム・ユーザのメンバ情報の検索クエリ
+    """
+    return select(RoomMember).where(
+        and_(RoomMember.room_id == room_id, RoomMember.user_id == user_id)
+    )
+
+
+def _member_in_target_user_query(member_id: int):
+    """
+    指定したユーザと同じルームに所属するユーザの検索クエリ
+    """
+    query = select(User).distinct()
+    query = query.join(RoomMember, RoomMember.user_id == User.id)
+    query = query.where(
+        RoomMember.room_id.in_(
+            select(RoomMember.room_id).where(RoomMember.user_id == member_id)
+        )
+    )
+
+    # メールアドレスで並び替え
+    return query.order_by(asc(User.mail_address))
+
+
+def _find_messages_query(
+    room_id: int, before_id: Optional[int], after_id: Optional[int], limit: int
+):
+    """
+    メッセージ履歴の検索クエリ
+    続きの有無を判定するため、1件多く取得する
+    """
+    query = select(
+        RoomMessage.id,
+        RoomMessage.user_id,
+        User.user_name,
+        RoomMessage.message,
+        RoomMessage.client_msg_id,
+        RoomMessage.create_date,
+    )
+    query = query.join(User, User.id == RoomMessage.user_id)
+    query = query.where(RoomMessage.room_id == room_id)
+
+    if after_id is not None:
+        query = query.where(RoomMessage.id > after_id)
+        return query.order_by(asc(RoomMessage.id)).limit(limit + 1)
+
+    if before_id is not None:
+        query = query.where(RoomMessage.id < before_id)
+    return query.order_by(desc(RoomMessage.id)).limit(limit + 1)
+
+
+def _to_message_page(
+    rows: List[Row], after_id: Optional[int], limit: int
+) -> Tuple[List[Row], bool]:
+    """
+    メッセージ履歴の検索結果を、ID昇順のページと続きの有無に変換
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if after_id is None:
+        rows.reverse()
+
+    return rows, has_more
+
+
+def _entry_messages_stmt():
+    """
+    メッセージ一括登録のINSERT文（登録済みのクライアントメッセージIDは読み飛ばす）
+    """
+    return (
+        insert(RoomMessage)
+        .on_conflict_do_nothing(
+            index_elements=[RoomMessage.user_id, RoomMessage.client_msg_id]
+        )
+        .returning(
+            RoomMessage.id,
+            RoomMessage.create_date,
+            RoomMessage.user_id,
+            RoomMessage.client_msg_id,
+        )
+    )
@@ -1,23 +1,32 @@
 from typing import Optional, Sequence, Tuple
 
-from sqlalchemy import func, select
+from sqlalchemy import select
 
 from api.entities.user import User
+from api.repositories.base import BaseRepo
 from api.std import sql
+from api.std.auth_cache import auth_cache
+from api.std.paging import SeekKey, fetch_page, fetch_page_async, order_by
+from api.std.routing import read_only
 
+# 一覧の並び順（削除フラグ、名前、ID順）
+LIST_KEYS = (SeekKey(User.del_flag), SeekKey(User.user_name), SeekKey(User.id))
 
-class UserRepo:
+
+class UserRepo(BaseRepo):
     """
     UserRepo
     ユーザマスタへのSQL処理を束ねたクラス
     """
 
+    @read_only
     def find(
         self,
         mail_address: Optional[str] = None,
         user_name: Optional[str] = None,
         offset: int = 0,
         limit: int = 10,
+        cursor: Optional[str] = None,
     ) -> Tuple[Sequence[User], int]:
         """
         指定した条件に合致するユーザを取得
@@ -26,32 +35,17 @@ class UserRepo:
                 user_name: 名前（部分一致）
                 offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
                 limit: 何件取得するか指定
+                cursor: 前後のページのカーソル（指定時は offset を使用しない）
             Returns:
                 Sequence: ヒットしたユーザ情報のリスト
                 int: ヒットした件数
         """
-        with sql.Session() as session:
-
-            query = select(User)
-            if mail_address:
-                query = query.where(User.mail_address.contains(mail_address))
-            if user_name:
-                query = query.where(User.user_name.contains(user_name))
-            # query = query.where(User.del_flag == 0)
-            query = query.order_by(User.del_flag, User.user_name)
-
-            # レコード件数取得
-            count_query = select(func.count()).select_from(query.subquery())
-            rec_count = session.execute(count_query).scalar() or 0
-
-            # オフセット指定
-            if offset >= 0:
-                query = query.offset(offset).limit(limit)
+        with self._session() as session:
 
-            # 検索実施
-            user_list = session.scalars(query).unique().all()
+            query = _find_query(mail_address, user_name)
 
-            return user_list, rec_count
+            # 検索実施（ページ分のデータとレコード件数を1回のSQLで取得）
+            return fetch_page(session, query, offset, limit, LIST_KEYS, cursor)
 
     def find_by_id(self, id: int) -> User:
         """
@@ -61,9 +55,20 @@ class UserRepo:
             Returns:
                 User: 取得したユーザ情報
         """
-        with sql.Session() as session:
+        with self._session() as session:
             return session.scalars(select(User).where(User.id == id)).unique().one()
 
+    def find_version(self, id: int) -> Optional[int]:
+        """
+        指定したユーザのバージョンを取得（セッションのログイン情報の確認用）
+            Args:
+                id: ユーザID
+            Returns:
+                int: ユーザのバージョン（削除済みの場合はNone）
+        """
+        with self._session() as session:
+            return session.scalar(select(User.version).where(User.id == id))
+
     def find_by_address(self, mail_address: str) -> User:
         """
         指定したメールドレスのユーザを取得
@@ -72,7 +77,7 @@ class UserRepo:
             Returns:
                 User: 取得したユーザ情報
         """
-        with sql.Session() as session:
+        with self._session() as session:
             return session.scalars(
                 select(User).where(User.mail_address == mail_address)
             ).first()
@@ -85,9 +90,9 @@ class UserRepo:
             Returns:
                 int: 登録したレコードのID
         """
-        with sql.Session() as session:
+        with self._session() as session:
             session.add(user)
-            session.commit()
+            self._commit(session)
             assert user.id is not None
             return user.id
 
@@ -99,19 +104,17 @@ class UserRepo:
             Returns:
 
         """
-        with sql.Session() as session:
+        with self._session() as session:
             current_user = (
                 session.scalars(select(User).where(User.id == user.id)).unique().one()
             )
-            current_user.update_user = user.update_user
-            current_user.mail_address = user.mail_address
-            current_user.user_name = user.user_name
-            if user.hashed_password != "":
-                current_user.hashed_password = user.hashed_password
-            current_user.authority_code = user.authority_code
-            current_user.del_flag = user.del_flag
+            _copy_user(user, current_user)
+            # ログイン中のセッションを再認証させる
+            current_user.version += 1
 
-            session.commit()
+            # パスワード・権限の変更を認証に反映させるため、認証済みのキャッシュを破棄
+            auth_cache.invalidate_on_commit(session, current_user.id)
+            self._commit(session)
 
     def delete(self, user: User):
         """
@@ -121,7 +124,120 @@ class UserRepo:
             Returns:
 
         """
-        with sql.Session() as session:
+        with self._session() as session:
             current_user = session.scalars(select(User).where(User.id == user.id)).one()
             session.delete(current_user)
-            session.commit()
+            auth_cache.invalidate_on_commit(session, current_user.id)
+            self._commit(session)
+
+
+class AsyncUserRepo:
+    """
+    AsyncUserRepo
+    UserRepo の非同期版
+    """
+
+    @read_only
+    async def find(
+        self,
+        mail_address: Optional[str] = None,
+        user_name: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Sequence[User], int]:
+        """
+        指定した条件に合致するユーザを取得（UserRepo.find を参照）
+        """
+        async with sql.AsyncSession() as session:
+
+            query = _find_query(mail_address, user_name)
+            return await fetch_page_async(
+                session, query, offset, limit, LIST_KEYS, cursor
+            )
+
+    async def find_by_id(self, id: int) -> User:
+        """
+        指定したアカウントコードのユーザを取得（UserRepo.find_by_id を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (
+                (await session.scalars(select(User).where(User.id == id)))
+                .unique()
+                .one()
+            )
+
+    async def find_by_address(self, mail_address: str) -> User:
+        """
+        指定したメールドレスのユーザを取得（UserRepo.find_by_address を参照）
+        """
+        async with sql.AsyncSession() as session:
+            return (
+                await session.scalars(
+                    select(User).where(User.mail_address == mail_address)
+                )
+            ).first()
+
+    async def create(self, user: User) -> int:
+        """
+        ユーザ情報を作成（UserRepo.create を参照）
+        """
+        async with sql.AsyncSession() as session:
+            session.add(user)
+            await session.commit()
+            assert user.id is not None
+            return user.id
+
+    async def update(self, user: User):
+        """
+        ユーザ情報を更新（UserRepo.update を参照）
+        """
+        async with sql.AsyncSession() as session:
+            current_user = (
+                (await session.scalars(select(User).where(User.id == user.id)))
+                .unique()
+                .one()
+            )
+            _copy_user(user, current_user)
+            current_user.version += 1
+
+            auth_cache.invalidate_on_commit(session.sync_session, current_user.id)
+            await session.commit()
+
+    async def delete(self, user: User):
+        """
+        ユーザ情報を削除（UserRepo.delete を参照）
+        """
+        async with sql.AsyncSession() as session:
+            current_user = (
+                await session.scalars(select(User).where(User.id == user.id))
+            ).one()
+            await session.delete(current_user)
+            auth_cache.invalidate_on_commit(session.sync_session, current_user.id)
+            await session.commit()
+
+
+def _find_query(mail_address: Optional[str], user_name: Optional[str]):
+    """
+    ユーザ一覧の検索クエリ
+    """
+    query = select(User)
+    if mail_address:
+        query = query.where(User.mail_address.contains(mail_address))
+    if user_name:
+        query = query.where(User.user_name.contains(user_name))
+    # query = query.where(User.del_flag == 0)
+    return query.order_by(*order_by(LIST_KEYS))
+
+
+def _copy_user(source: User, target: User):
+    """
+    更新対象の項目をコピー（パスワードは入力された場合のみ）
+    """
+    target.update_user = source.update_user
+    target.mail_address = source.mail_address
+    target.user_name = source.user_name
+    if source.hashed_password != "":
+        target.hashed_password = source.hashed_password
+    target.authority_code = source.authority_code
+    target.del_flag = source.del_flag
@@ -1,74 +1,52 @@
 import math
+import uuid
 from datetime import datetime
 from os import getenv
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import unquote
 
-from fastapi import APIRouter, Cookie, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi import (
+    APIRouter,
+    Cookie,
+    Depends,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
-from api.entities.room_message import RoomMessage
 from api.entities.user import User
 from api.services import auth
 from api.services import room as s_room
-from api.std import define
+from api.services.connection import PONG_FRAME, manager
+from api.services.message_buffer import history_buffer
+from api.services.message_guard import guard
+from api.services.message_writer import REJECT_NOT_PERSISTED, writer
+from api.std import define, serializer, sql
 
 # 初期設定
-router = APIRouter()
+router = APIRouter(default_response_class=serializer.JSONResponse)
 router.mount("/static", StaticFiles(directory="ui/static"), name="static")
 templates = Jinja2Templates(directory="ui/templates")
 
 
-# 接続管理
-class ConnectionManager:
-    def __init__(self):
-        # {room_id: List[{"websocket": WebSocket, "user_id": str, "user_name": str}]}
-        self.active_connections: Dict[str, List[Dict]] = {}
-
-    async def connect(
-        self, websocket: WebSocket, room_id: str, user_id: str, user_name: str
-    ):
-        await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-
-        self.active_connections[room_id].append(
-            {"websocket": websocket, "user_id": user_id, "user_name": user_name}
-        )
-
-    def disconnect(self, websocket: WebSocket):
-        for room_id, connections in self.active_connections.items():
-            for conn in connections:
-                if conn["websocket"] == websocket:
-                    connections.remove(conn)
-                    break
-
-    async def broadcast(self, room_id: str, sender_name: str, message: str):
-        if room_id not in self.active_connections:
-            return
-        for conn in self.active_connections[room_id]:
-            await conn["websocket"].send_json(
-                {"sender": sender_name, "message": message}
-            )
-
-
-manager = ConnectionManager()
-
-
 @router.get("/chat/{p_room_id}/form")
 def room_form(
     request: Request,
     p_room_id: int,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ルーム情報入力画面：ロード
     """
 
     # ルームクラスのインスタンス生成
-    e_room = s_room.get_room(p_room_id)
+    e_room = s_room.get_chat_room(p_room_id, session)
 
     return templates.TemplateResponse(
         "chat.html",
@@ -84,41 +62,212 @@ def room_form(
 
 @router.websocket("/ws/{room_id}/{user_id}/{user_name}")
 async def websocket_endpoint(
-    websocket: WebSocket, room_id: str, user_id: str, user_name: str
+    websocket: WebSocket,
+    room_id: str,
+    user_id: str,
+    user_name: str,
+    last_id: Optional[int] = None,
 ):
-    await manager.connect(websocket, room_id, user_id, user_name)
+    """
+    チャット送受信
+        last_id: 再接続時に指定（受信済みの最後のメッセージID）
+                 指定した場合は、それより後のメッセージを送信してから配信を開始する
+    """
+    # ルームID・ユーザIDが数値でない接続は受け付けない（受信ループ内で変換しない）
     try:
+        room_no, user_no = int(room_id), int(user_id)
+    except ValueError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # ログイン済みのユーザ本人の接続のみ受け付ける（パスワードの照合は行わない）
+    if not await auth.check_websocket_auth(websocket, user_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await manager.connect(websocket, room_id, user_id, user_name, ready=last_id is None)
+    try:
+        # 切断中に登録されたメッセージを送信
+        if last_id is not None:
+            await send_missed_messages(websocket, room_no, last_id)
+            manager.mark_ready(websocket)
+
         while True:
-            message = await websocket.receive_text()
+            text = await websocket.receive_text()
+            manager.touch(websocket)
 
-            # メッセージクラスへセット
-            e_message = RoomMessage()
-            e_message.room_id = room_id
-            e_message.user_id = user_id
-            e_message.message = message
+            # 死活監視の応答
+            if text == PONG_FRAME:
+                continue
 
-            # メッセージ登録
-            s_room.entry_message(e_message)
+            # 入力チェック・流量制限（DBへは問い合わせずに判定し、送信者へのみ通知）
+            client_msg_id = None
+            reason = guard.check_frame(text)
+            if reason is None:
+                message, client_msg_id = parse_message(text)
+                reason = guard.check_message(room_id, user_id, message)
+            if reason is not None:
+                manager.send_personal(
+                    websocket,
+                    {"type": "error", "reason": reason, "client_msg_id": client_msg_id},
+                )
+                continue
 
-            # room_id に接続している全員に user_name で送信
+            # メッセージ登録（キューへ積むだけで、登録はバックグラウンドで一括実施）
+            #   再送されたメッセージ（受付済み）の場合は配信もしない
+            accepted = await writer.put(
+                room_no, user_no, user_name, message, client_msg_id
+            )
+            if not accepted:
+                continue
+
+            # room_id に接続している全員に user_name で送信（登録完了は待たない）
             await manager.broadcast(
                 room_id,
-                user_name,
-                message,
+                {
+                    "type": "message",
+                    "sender": user_name,
+                    "message": message,
+                    "client_msg_id": client_msg_id,
+                },
             )
 
     except WebSocketDisconnect:
+        pass
+
+    finally:
+        # 切断・例外いずれの場合も配信対象から外す
         manager.disconnect(websocket)
 
 
+def parse_message(text: str) -> Tuple[str, str]:
+    """
+    受信データからメッセージとクライアントメッセージIDを取り出す
+        受信データは {"message": "...", "client_msg_id": "..."} 形式のJSON
+        （JSON以外の場合は受信データ全体をメッセージとし、IDはサーバで採番する）
+    """
+    try:
+        data = serializer.loads(text)
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or not isinstance(data.get("message"), str):
+        return text, uuid.uuid4().hex
+
+    client_msg_id = data.get("client_msg_id")
+    if (
+        not isinstance(client_msg_id, str)
+        or not client_msg_id
+        or len(client_msg_id) > define.CHAT_CLIENT_MSG_ID_MAX_LEN
+    ):
+        client_msg_id = uuid.uuid4().hex
+
+    return data["message"], client_msg_id
+
+
+async def send_missed_messages(websocket: WebSocket, room_id: int, last_id: int):
+    """
+    指定したIDより後に登録されたメッセージを送信（再接続時の差分送信）
+    件数が多すぎる場合は履歴の再読込を指示する
+    """
+    after_id = last_id
+    sent = 0
+    while True:
+        messages, has_more = await s_room.find_messages_async(
+            room_id, None, after_id, define.CHAT_HISTORY_PAGE_MAX
+        )
+        sent += len(messages)
+        if sent > define.CHAT_RESUME_MAX:
+            await websocket.send_text(serializer.dumps({"type": "reset"}))
+            return
+
+        for message in messages:
+            await websocket.send_text(
+                serializer.dumps(
+                    {
+                        "type": "message",
+                        "id": message["id"],
+                        "sender": message["user_name"],
+                        "message": message["message"],
+                        "client_msg_id": message["client_msg_id"],
+                    }
+                )
+            )
+
+        if not has_more or not messages:
+            return
+        after_id = messages[-1]["id"]
+
+
+async def notify_persisted(messages: List[Dict]):
+    """
+    登録が完了した最後のメッセージIDとクライアントメッセージIDをルームごとに配信
+    （クライアントは受信済みIDを更新し、再接続時の差分送信の起点にする
+      また、登録が完了したメッセージを再送対象から外す）
+    """
+    last_ids: Dict[str, int] = {}
+    client_msg_ids: Dict[str, List[str]] = {}
+    for message in messages:
+        room_id = str(message["room_id"])
+        last_ids[room_id] = max(last_ids.get(room_id, 0), message["id"])
+        client_msg_ids.setdefault(room_id, []).append(message["client_msg_id"])
+
+    for room_id, last_id in last_ids.items():
+        await manager.broadcast(
+            room_id,
+            {
+                "type": "sync",
+                "last_id": last_id,
+                "client_msg_ids": client_msg_ids[room_id],
+            },
+        )
+
+
+def notify_failed(messages: List[Dict]):
+    """
+    登録できなかったメッセージを、このプロセスに接続している送信者へ通知
+    （クライアントはエラーを表示し、そのメッセージを再送対象から外す）
+    """
+    for message in messages:
+        room_id = str(message["room_id"])
+        for conn in manager.get_user_connections(str(message["user_id"])):
+            if conn.room_id != room_id:
+                continue
+            manager.send_personal(
+                conn.websocket,
+                {
+                    "type": "error",
+                    "reason": REJECT_NOT_PERSISTED,
+                    "client_msg_id": message["client_msg_id"],
+                },
+            )
+
+
+# 登録が完了したメッセージを直近メッセージのバッファへ追加し、登録済みIDを配信
+writer.add_listener(history_buffer.append)
+writer.add_listener(notify_persisted)
+# 登録できなかったメッセージを送信者へ通知
+writer.add_failure_listener(notify_failed)
+
+
 @router.get("/chat/{p_room_id}/api")
-def chat_set_message(p_room_id: int):
+async def chat_set_message(
+    p_room_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = define.CHAT_HISTORY_PAGE_SIZE,
+):
     """
-    チャット画面：ロード（APIコール）
+    チャット画面：メッセージ履歴取得（APIコール）
+        before_id, after_id とも未指定の場合は最新のメッセージを返す
     """
-    # ルームクラスのインスタンス生成
-    e_room = s_room.get_room(p_room_id)
+    limit = max(1, min(limit, define.CHAT_HISTORY_PAGE_MAX))
+
+    messages, has_more = await s_room.find_messages_async(
+        p_room_id, before_id, after_id, limit
+    )
 
     return {
-        "messages": e_room.messages,
+        "messages": messages,
+        "has_more": has_more,
     }
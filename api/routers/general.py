@@ -7,11 +7,12 @@ from fastapi import APIRouter, Cookie, Depends, Form, Request
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.orm import Session
 
 from api.entities.general import General
 from api.entities.user import User
 from api.services import general as s_general
-from api.std import define
+from api.std import define, sql
 from api.services import auth
 
 
@@ -27,14 +28,16 @@ def general_list(
     sel_category: str = Cookie(""),
     txt_code_value: str = Cookie(""),
     hdn_page_no: int = Cookie(0),
+    hdn_cursor: str = Cookie(""),
     sel_row_max: int = Cookie(define.SEARCH_LIST_DISP_CNT[0]),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     マスタメンテナンス（汎用マスタ） 一覧画面
     """
 
-    category_list = s_general.get_select_list()
+    category_list = s_general.get_select_list(session)
 
     # URLパラメータのデコード実施
     sel_category, txt_code_value = s_general.set_search_decode(
@@ -42,9 +45,15 @@ def general_list(
     )
 
     # 検索処理実施
+    #   前後のページへの移動時はカーソル（前ページの先頭・末尾）の続きを取得
     if hdn_page_no != 0:
         general_list, rec_count = s_general.search_general_list(
-            sel_category, txt_code_value, (hdn_page_no - 1) * sel_row_max, sel_row_max
+            sel_category,
+            txt_code_value,
+            (hdn_page_no - 1) * sel_row_max,
+            sel_row_max,
+            session,
+            hdn_cursor,
         )
     else:
         # 初回ロード時
@@ -86,6 +95,7 @@ def general_list(
             "page_count": page_count,
             "page_max_disp": page_max_disp,
             "rec_count": rec_count,
+            "cursors": s_general.get_list_cursors(general_list),
             "result": "",
             "sys_msg": "",
             "login_user": login_user,
@@ -98,6 +108,7 @@ def general_list_download(
     sel_category: str = Cookie(""),
     txt_code_value: str = Cookie(""),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     機種情報 一覧画面 ダウンロード処理
@@ -110,7 +121,7 @@ def general_list_download(
 
     # 検索処理実施
     general_list, rec_count = s_general.search_general_list(
-        sel_category, txt_code_value, -1, -1
+        sel_category, txt_code_value, -1, -1, session
     )
 
     # エクセル生成
@@ -134,8 +145,11 @@ def general_form_new(
     request: Request,
     sel_category: str = Cookie(""),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
-    return general_form_edit(request, p_category=sel_category, login_user=login_user)
+    return general_form_edit(
+        request, p_category=sel_category, login_user=login_user, session=session
+    )
 
 
 @router.get("/general/{p_category}/{p_code}/{mode}")
@@ -145,17 +159,18 @@ def general_form_edit(
     p_category: str = "",
     mode: str = "edit",
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     汎用マスタ情報入力画面：ロード
     """
 
     # カテゴリのリストを取得する
-    category_list = s_general.get_select_list()
+    category_list = s_general.get_select_list(session)
 
     if p_code != -1:
         # 汎用マスタ情報管理クラスのインスタンス生成
-        e_general = s_general.get_general(p_code, p_category)
+        e_general = s_general.get_general(p_code, p_category, session)
     else:
         e_general = General()
         e_general.category = p_category
@@ -184,17 +199,18 @@ def general_entry(
     txt_remarks: str = Form(""),
     chk_del_flag: bool = Form(False),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     汎用マスタ情報入力画面：登録・更新処理
     """
 
     # カテゴリのリストを取得する
-    category_list = s_general.get_select_list()
+    category_list = s_general.get_select_list(session)
 
     # 汎用マスタ管理クラスのインスタンス生成
     if txt_code:
-        e_general = s_general.get_general(int(txt_code), sel_category)
+        e_general = s_general.get_general(int(txt_code), sel_category, session)
     else:
         e_general = General()
         e_general.code = -1
@@ -206,18 +222,18 @@ def general_entry(
     e_general.remarks = txt_remarks
     e_general.del_flag = chk_del_flag
 
-    is_unique = s_general.duplicate_check(e_general)
+    is_unique = s_general.duplicate_check(e_general, session)
 
     if is_unique:
         # ▼登録処理
         if e_general.code == -1:
             # ▼新規
-            e_general.code = s_general.create_general(e_general)
+            e_general.code = s_general.create_general(e_general, session)
             sys_msg = "登録処理が正常に完了しました。"
 
         else:
             # ▼更新
-            e_general = s_general.update_general(e_general)
+            e_general = s_general.update_general(e_general, session)
             sys_msg = "更新処理が正常に完了しました。"
 
         # リターンコード設定
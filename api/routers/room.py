@@ -9,12 +9,13 @@ from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 from api.entities.room_message import RoomMessage
 from api.entities.user import User
 from api.services import auth
 from api.services import room as s_room
-from api.std import define
+from api.std import define, serializer, sql
 
 
 # ルーム登録時の受信データのスキーマを定義
@@ -26,7 +27,7 @@ class RoomEntry(BaseModel):
 
 
 # 初期設定
-router = APIRouter()
+router = APIRouter(default_response_class=serializer.JSONResponse)
 router.mount("/static", StaticFiles(directory="ui/static"), name="static")
 templates = Jinja2Templates(directory="ui/templates")
 
@@ -36,8 +37,10 @@ def room_list(
     request: Request,
     txt_room_name: str = Cookie(""),
     hdn_page_no: int = Cookie(0),
+    hdn_cursor: str = Cookie(""),
     sel_row_max: int = Cookie(define.SEARCH_LIST_DISP_CNT[0]),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ルーム 一覧画面
@@ -46,11 +49,14 @@ def room_list(
     txt_room_name = unquote(txt_room_name)
 
     # 検索処理実施
+    #   前後のページへの移動時はカーソル（前ページの先頭・末尾）の続きを取得
     room_list, rec_count = s_room.find_rooms(
         txt_room_name,
         login_user.id,
         (hdn_page_no - 1) * sel_row_max,
         sel_row_max,
+        session,
+        hdn_cursor,
     )
 
     # ▼検索処理
@@ -85,6 +91,7 @@ def room_list(
             "page_count": page_count,
             "page_max_disp": page_max_disp,
             "rec_count": rec_count,
+            "cursors": s_room.get_list_cursors(room_list),
             "result": "",
             "sys_msg": "",
             "login_user": login_user,
@@ -97,16 +104,17 @@ def room_form(
     request: Request,
     p_room_id: int,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ルーム情報入力画面：ロード
     """
 
     # ルームクラスのインスタンス生成
-    e_room = s_room.get_room(p_room_id)
+    e_room = s_room.get_room(p_room_id, session)
 
     # 選択メンバーリスト取得
-    select_input_dict = s_room.get_selected_lists(login_user.id)
+    select_input_dict = s_room.get_selected_lists(login_user.id, session)
 
     return templates.TemplateResponse(
         "room_form.html",
@@ -122,12 +130,12 @@ def room_form(
 
 
 @router.get("/room/{p_room_id}/api")
-def room_set_member(p_room_id: int):
+def room_set_member(p_room_id: int, session: Session = Depends(sql.get_session)):
     """
     ルーム情報入力画面：ロード（APIコール）
     """
     # ルームクラスのインスタンス生成
-    e_room = s_room.get_room(p_room_id)
+    e_room = s_room.get_room(p_room_id, session)
 
     return {
         "members": e_room.members,
@@ -138,13 +146,15 @@ def room_set_member(p_room_id: int):
 def room_entry(
     data: RoomEntry,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ルーム情報入力画面：登録・更新処理
+    1リクエスト（1トランザクション）で登録し、レスポンス返却前にコミットする
     """
 
     # ユーザクラスのインスタンス生成
-    e_room = s_room.get_room(int(data.room_id) if data.room_id != "" else 0)
+    e_room = s_room.get_room(int(data.room_id) if data.room_id != "" else 0, session)
 
     # 入力値取得
     e_room.room_name = data.room_name
@@ -156,14 +166,14 @@ def room_entry(
     # ▼登録処理
     if e_room.id is None:
         # ▼新規
-        e_room = s_room.create_room(e_room, data.members)
+        e_room = s_room.create_room(e_room, data.members, session)
         # リターンコード設定
         sys_msg = "登録処理が正常に完了しました。"
         result = "complete"
 
     else:
         # ▼更新
-        e_room = s_room.update_room(e_room, data.members)
+        e_room = s_room.update_room(e_room, data.members, session)
         # リターンコード設定
         sys_msg = "更新処理が正常に完了しました。"
         result = "complete"
@@ -180,15 +190,16 @@ def room_form(
     request: Request,
     p_room_id: int,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ルーム情報入力画面：ロード
     """
 
     # ルームクラスのインスタンス生成
-    e_room = s_room.get_room(p_room_id)
+    e_room = s_room.get_room(p_room_id, session)
 
     # 削除処理実施
-    s_room.delete_room(e_room)
+    s_room.delete_room(e_room, session)
 
     return RedirectResponse("/room/list")
@@ -7,10 +7,11 @@ from fastapi import APIRouter, Cookie, Depends, Form, Request
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.orm import Session
 
 from api.entities.user import User
 from api.services import user as s_user
-from api.std import define, func
+from api.std import define, func, sql
 from api.services import auth
 
 
@@ -26,8 +27,10 @@ def user_list(
     txt_mail_address: str = Cookie(""),
     txt_user_name: str = Cookie(""),
     hdn_page_no: int = Cookie(0),
+    hdn_cursor: str = Cookie(""),
     sel_row_max: int = Cookie(define.SEARCH_LIST_DISP_CNT[0]),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ユーザ 一覧画面
@@ -36,12 +39,15 @@ def user_list(
     txt_user_name = s_user.set_search_decode(txt_user_name)
 
     # 検索処理実施
+    #   前後のページへの移動時はカーソル（前ページの先頭・末尾）の続きを取得
     if hdn_page_no != 0:
         user_list, rec_count = s_user.find_users(
             txt_mail_address,
             txt_user_name,
             (hdn_page_no - 1) * sel_row_max,
             sel_row_max,
+            session,
+            hdn_cursor,
         )
     else:
         # 初回ロード時
@@ -82,6 +88,7 @@ def user_list(
             "page_count": page_count,
             "page_max_disp": page_max_disp,
             "rec_count": rec_count,
+            "cursors": s_user.get_list_cursors(user_list),
             "result": "",
             "sys_msg": "",
             "login_user": login_user,
@@ -94,6 +101,7 @@ def user_list_download(
     txt_mail_address: str = Cookie(""),
     txt_user_name: str = Cookie(""),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ユーザ 一覧画面 ダウンロード処理
@@ -103,7 +111,9 @@ def user_list_download(
     txt_user_name = s_user.set_search_decode(txt_user_name)
 
     # 検索処理実施
-    user_list, rec_count = s_user.find_users(txt_mail_address, txt_user_name, -1, -1)
+    user_list, rec_count = s_user.find_users(
+        txt_mail_address, txt_user_name, -1, -1, session
+    )
 
     # エクセル生成
     xl = s_user.create_download_file(user_list)
@@ -125,8 +135,9 @@ def user_list_download(
 def user_form_new(
     request: Request,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
-    return user_form_edit(request, 0, "new", login_user=login_user)
+    return user_form_edit(request, 0, "new", login_user=login_user, session=session)
 
 
 @router.get("/user/{p_user_id}/{mode}")
@@ -135,16 +146,17 @@ def user_form_edit(
     p_user_id: int,
     mode: str,
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ユーザ情報入力画面：ロード
     """
 
     # ユーザクラスのインスタンス生成
-    e_user = s_user.get_user(p_user_id)
+    e_user = s_user.get_user(p_user_id, session)
 
     # 権限リスト取得
-    select_input_dict = s_user.get_selected_lists()
+    select_input_dict = s_user.get_selected_lists(session)
 
     return templates.TemplateResponse(
         "user_form.html",
@@ -170,13 +182,14 @@ def user_entry(
     sel_auth_code: str = Form(""),
     chk_del_flag: bool = Form(False),
     login_user: User = Depends(auth.check_auth),
+    session: Session = Depends(sql.get_session),
 ):
     """
     ユーザ入力画面：登録・更新処理
     """
 
     # ユーザクラスのインスタンス生成
-    e_user = s_user.get_user(int(hdn_user_id) if hdn_user_id != "" else 0)
+    e_user = s_user.get_user(int(hdn_user_id) if hdn_user_id != "" else 0, session)
 
     # 入力値取得
     e_user.mail_address = txt_mail_address
@@ -192,9 +205,9 @@ def user_entry(
         # ▼新規
 
         # 入力チェック
-        is_valid, sys_msg = s_user.check_user(e_user, "new")
+        is_valid, sys_msg = s_user.check_user(e_user, "new", session)
         if is_valid:
-            e_user = s_user.create_user(e_user)
+            e_user = s_user.create_user(e_user, session)
             # リターンコード設定
             sys_msg = "登録処理が正常に完了しました。"
             result = "complete"
@@ -207,9 +220,9 @@ def user_entry(
     else:
         # ▼更新
         # 入力チェック
-        is_valid, sys_msg = s_user.check_user(e_user, "update")
+        is_valid, sys_msg = s_user.check_user(e_user, "update", session)
         if is_valid:
-            e_user = s_user.update_user(e_user)
+            e_user = s_user.update_user(e_user, session)
             # リターンコード設定
             sys_msg = "更新処理が正常に完了しました。"
             result = "complete"
@@ -220,7 +233,7 @@ def user_entry(
             mode = "edit"
 
     # 権限リスト取得
-    select_input_dict = s_user.get_selected_lists()
+    select_input_dict = s_user.get_selected_lists(session)
 
     return templates.TemplateResponse(
         "user_form.html",
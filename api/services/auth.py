@@ -1,39 +1,159 @@
-from fastapi import Depends, HTTPException, Request, status
+import time
+from typing import Dict, Optional
+
+from fastapi import Depends, HTTPException, Request, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.requests import HTTPConnection
 
+from api.entities.general import General
 from api.entities.user import User
 from api.repositories.user import UserRepo
-from api.services.permission import check_permission
-from api.std import func
+from api.services.permission import AUTHORITY_CATEGORY, check_permission
+from api.std import func, sql
+from api.std.auth_cache import auth_cache
+from api.std.env import env_float
 
 security = HTTPBasic()
 
+# ログインユーザが未解決であることを表す値（認証失敗時の None と区別する）
+_UNRESOLVED = object()
+
+# ログイン情報を保持するセッション（SessionMiddleware の署名付きCookie）のキー
+SESSION_LOGIN_KEY = "login"
+
+# セッションのログイン情報の有効期間（秒、0以下の場合はセッションで認証しない）
+SESSION_LOGIN_TTL = env_float("SESSION_LOGIN_TTL_SEC", 28800)
+
+# セッションのログイン情報をユーザのバージョンと照合する間隔（秒）
+SESSION_LOGIN_RECHECK = env_float("SESSION_LOGIN_RECHECK_SEC", 60)
+
+
+async def get_credentials(request: Request) -> HTTPBasicCredentials:
+    """
+    ベーシック認証の認証情報を取得（1リクエストにつき1回だけ解析し、request.state に保持）
+        Args:
+            request: リクエスト
+        Returns:
+            HTTPBasicCredentials: 認証情報（未指定の場合は401の例外を発生）
+    """
+    credentials = getattr(request.state, "credentials", None)
+    if credentials is None:
+        credentials = await security(request)
+        request.state.credentials = credentials
+    return credentials
+
+
+def resolve_login_user(
+    request: Request,
+    credentials: HTTPBasicCredentials,
+    session: Optional[Session] = None,
+) -> Optional[User]:
+    """
+    ログインユーザを取得（1リクエストにつき1回だけ照合し、request.state に保持）
+    ミドルウェア・認証処理・ログ出力で同じ結果を使用する
+    セッションに有効なログイン情報がある場合は、パスワードの照合・ユーザの検索を行わない
+        Args:
+            request: リクエスト
+            credentials: 認証情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        Returns:
+            User: ログイン者のユーザ情報（認証に失敗した場合はNone）
+    """
+    login_user = getattr(request.state, "login_user", _UNRESOLVED)
+    if login_user is _UNRESOLVED:
+        login_user = get_session_user(request, credentials.username, session)
+        if login_user is None:
+            login_user = _authenticate(credentials, session)
+            _save_session_login(request, login_user)
+        request.state.login_user = login_user
+    return login_user
+
+
+def get_session_user(
+    conn: HTTPConnection,
+    mail_address: Optional[str] = None,
+    session: Optional[Session] = None,
+) -> Optional[User]:
+    """
+    セッションのログイン情報からユーザを取得
+    一定間隔でユーザのバージョンと照合し、更新・削除されたユーザは再認証させる
+        Args:
+            conn: リクエスト・WebSocket
+            mail_address: 認証情報のメールアドレス（指定時は一致する場合のみ有効）
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        Returns:
+            User: ログイン情報から作成したユーザ（参照のみで使用すること、無効な場合はNone）
+    """
+    if SESSION_LOGIN_TTL <= 0 or "session" not in conn.scope:
+        return None
+    login = conn.session.get(SESSION_LOGIN_KEY)
+    if not isinstance(login, dict):
+        return None
+
+    now = time.time()
+    try:
+        if login["exp"] <= now:
+            return None
+        if mail_address is not None and login["mail"] != mail_address:
+            return None
+        # 他のプロセスでの更新は照合する間隔ごとに、このプロセスでの更新は直ちに反映
+        expired = now - login["chk"] >= SESSION_LOGIN_RECHECK
+        revoked = login["chk"] <= auth_cache.revoked_at(login["uid"])
+        if expired or revoked:
+            if UserRepo(session).find_version(login["uid"]) != login["ver"]:
+                conn.session.pop(SESSION_LOGIN_KEY, None)
+                return None
+            login["chk"] = now
+        return _session_user(login)
+    except (KeyError, TypeError):
+        return None
+
+
+async def check_websocket_auth(websocket: WebSocket, user_id: str) -> bool:
+    """
+    WebSocketの接続元がログイン済みのユーザ本人かどうかをセッションから確認
+        Args:
+            websocket: 接続要求
+            user_id: 接続先のURLで指定されたユーザID
+        Returns:
+            bool: 接続を受け付ける場合はTrue（セッションで認証しない設定の場合は常にTrue）
+    """
+    if SESSION_LOGIN_TTL <= 0:
+        return True
+    login_user = await run_in_threadpool(get_session_user, websocket)
+    return login_user is not None and str(login_user.id) == user_id
+
 
 def check_auth(
-    request: Request, credentials: HTTPBasicCredentials = Depends(security)
+    request: Request,
+    credentials: HTTPBasicCredentials = Depends(get_credentials),
+    session: Session = Depends(sql.get_session),
 ) -> User:
     """
     ベーシック認証による認証処理
         Args:
             credentials認証情報
+            session: リクエスト単位のセッション
         Returns:
             User: ログイン者のユーザ情報
     """
 
-    mail_address = credentials.username
-    in_password = func.convert_password(credentials.password)
-
-    login_user = UserRepo().find_by_address(mail_address)
+    login_user = resolve_login_user(request, credentials, session)
 
-    if login_user is None or login_user.hashed_password != in_password:
+    if login_user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="ユーザ名かパスワードが間違っています",
             headers={"WWW-Authenticate": "Basic"},
         )
-    else:
-        check_permission(request, login_user)
-        return login_user
+
+    check_permission(request, login_user)
+    # 更新後の一定時間、このユーザの参照をプライマリへ送るためにセッションへ記録
+    session.info["user_id"] = login_user.id
+    return login_user
 
 
 async def get_user_info(request: Request) -> str:
@@ -45,8 +165,8 @@ async def get_user_info(request: Request) -> str:
         生成した文字列（ユーザID - ユーザ名）
 
     """
-    credentials: HTTPBasicCredentials | None = await security(request)
-    if credentials is None or credentials.username == "":
+    credentials = await get_credentials(request)
+    if credentials.username == "":
         raise HTTPException(
             status_code=401,
             detail="Unauthorized",
@@ -54,10 +174,83 @@ async def get_user_info(request: Request) -> str:
         )
     mail_address = credentials.username
     try:
-        login_user = UserRepo().find_by_address(mail_address)
+        # DBを参照する場合に備えてスレッドプールで実行（イベントループを止めない）
+        login_user = await run_in_threadpool(resolve_login_user, request, credentials)
         user_name = login_user.user_name if login_user is not None else ""
 
     except Exception:
         user_name = "ユーザ名不明"
 
     return f"{mail_address} - {user_name}"
+
+
+def _authenticate(
+    credentials: HTTPBasicCredentials, session: Optional[Session]
+) -> Optional[User]:
+    """
+    認証情報を照合してユーザを取得
+    """
+    mail_address = credentials.username
+
+    # 同じ認証情報で認証済みの場合はDBを参照しない
+    login_user = auth_cache.get(mail_address, credentials.password)
+    if login_user is not None:
+        return login_user
+
+    in_password = func.convert_password(credentials.password)
+    user_repo = UserRepo(session)
+    login_user = user_repo.find_by_address(mail_address)
+    if login_user is None or login_user.hashed_password != in_password:
+        return None
+
+    # リクエストをまたいで参照するため、セッションから切り離してキャッシュ
+    auth_cache.put(mail_address, credentials.password, user_repo.detach(login_user))
+    return login_user
+
+
+def _save_session_login(request: Request, login_user: Optional[User]):
+    """
+    認証結果をセッションのログイン情報へ保存（認証に失敗した場合は破棄）
+    """
+    if SESSION_LOGIN_TTL <= 0 or "session" not in request.scope:
+        return
+    if login_user is None:
+        request.session.pop(SESSION_LOGIN_KEY, None)
+        return
+
+    now = time.time()
+    authority = login_user.authority[0] if login_user.authority else None
+    request.session[SESSION_LOGIN_KEY] = {
+        "uid": login_user.id,
+        "mail": login_user.mail_address,
+        "name": login_user.user_name,
+        "code": login_user.authority_code,
+        "auth": authority.code_value if authority is not None else None,
+        "ver": login_user.version,
+        "exp": now + SESSION_LOGIN_TTL,
+        "chk": now,
+    }
+
+
+def _session_user(login: Dict) -> User:
+    """
+    セッションのログイン情報からユーザを作成（DBを参照しない）
+    """
+    user = User(
+        id=login["uid"],
+        mail_address=login["mail"],
+        user_name=login["name"],
+        authority_code=login["code"],
+        version=login["ver"],
+    )
+    authority = []
+    if login["auth"] is not None:
+        authority.append(
+            General(
+                category=AUTHORITY_CATEGORY,
+                code=login["code"],
+                code_value=login["auth"],
+            )
+        )
+    set_committed_value(user, "authority", authority)
+    return user
@@ -0,0 +1,351 @@
+import asyncio
+import time
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from api.services.pubsub import InProcessBackend, create_backend
+from api.std import serializer
+from api.std.env import env_float, env_int, env_str
+from api.std.logging import log
+
+"""
+    connection.py
+    WebSocket接続の管理とルーム内への配信処理
+"""
+
+# 送信キューが溢れた（受信が遅い）接続の扱い
+#   drop       : 溢れたメッセージを破棄して接続は維持
+#   disconnect : 接続を切断
+OVERFLOW_DROP = "drop"
+OVERFLOW_DISCONNECT = "disconnect"
+
+# 送信キュー溢れで切断する際のクローズコード（1013: Try Again Later）
+CLOSE_CODE_SLOW_CONSUMER = 1013
+
+# 無通信のまま一定時間経過した接続を切断する際のクローズコード
+CLOSE_CODE_IDLE_TIMEOUT = 4000
+
+# 死活監視（サーバからping、クライアントはpongを返す）の送受信データ
+PING_FRAME = serializer.dumps({"type": "ping"})
+PONG_FRAME = serializer.dumps({"type": "pong"})
+
+
+class Connection:
+    """
+    Connection
+    1接続分の情報（辞書より省メモリな __slots__ 付きクラス）
+    """
+
+    __slots__ = (
+        "websocket",
+        "room_id",
+        "user_id",
+        "user_name",
+        "queue",
+        "task",
+        "ready",
+        "last_seen",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        user_id: str,
+        user_name: str,
+        queue: asyncio.Queue,
+    ):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.queue = queue
+        self.task: Optional[asyncio.Task] = None
+        # 送信開始可否（再接続時の差分送信が終わるまでは配信を送信キューに溜めておく）
+        self.ready = asyncio.Event()
+        # 最後にクライアントから受信した時刻（time.monotonic）
+        self.last_seen = time.monotonic()
+
+
+class ConnectionManager:
+    """
+    ConnectionManager
+    WebSocket接続を管理し、ルーム単位で配信するクラス
+        ・接続ごとに上限付きの送信キューと送信タスクを持つ
+        ・配信は各送信キューへ積むだけで、実際の送信は接続ごとに並行して行う
+        ・WebSocket、ユーザIDからの逆引き索引を持ち、切断はO(1)で行う
+        ・他のワーカーへの配信はPub/Sub（backend）経由で行う
+        ・一定間隔でpingを送り、無通信のまま idle_timeout 秒経過した接続は切断する
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 100,
+        overflow: str = OVERFLOW_DISCONNECT,
+        backend=None,
+        heartbeat_interval: float = 30,
+        idle_timeout: float = 90,
+    ):
+        # {room_id: Set[Connection]}
+        self.rooms: Dict[str, Set[Connection]] = {}
+        # {id(WebSocket): Connection}（WebSocketはハッシュ不可のためidをキーにする）
+        self._by_socket: Dict[int, Connection] = {}
+        # {user_id: Set[Connection]}
+        self._by_user: Dict[str, Set[Connection]] = {}
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.backend = backend if backend is not None else InProcessBackend()
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self._reaper_task: Optional[asyncio.Task] = None
+        # 実行中のクローズ処理（完了まで参照を保持し、途中で破棄されないようにする）
+        self._close_tasks: Set[asyncio.Task] = set()
+
+        # 配信状況のカウンタ
+        self.stats = {
+            "sent": 0,
+            "dropped": 0,
+            "slow_disconnected": 0,
+            "send_failed": 0,
+            "pings": 0,
+            "reaped_idle": 0,
+        }
+
+    async def start(self):
+        """
+        Pub/Subの受信と死活監視を開始
+        """
+        await self.backend.start(self._deliver)
+        if self.heartbeat_interval > 0:
+            self._reaper_task = asyncio.create_task(self._reaper())
+
+    async def stop(self):
+        """
+        Pub/Subと死活監視を停止
+        """
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        if self._close_tasks:
+            await asyncio.gather(*self._close_tasks, return_exceptions=True)
+        await self.backend.stop()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        user_id: str,
+        user_name: str,
+        ready: bool = True,
+    ):
+        """
+        接続を登録
+            Args:
+                ready: Falseの場合は mark_ready が呼ばれるまで配信の送信を保留する
+        """
+        await websocket.accept()
+
+        conn = Connection(
+            websocket,
+            room_id,
+            user_id,
+            user_name,
+            asyncio.Queue(maxsize=self.queue_size),
+        )
+        if ready:
+            conn.ready.set()
+        conn.task = asyncio.create_task(self._sender(conn))
+
+        self.rooms.setdefault(room_id, set()).add(conn)
+        self._by_socket[id(websocket)] = conn
+        self._by_user.setdefault(user_id, set()).add(conn)
+
+    def disconnect(self, websocket: WebSocket):
+        conn = self._by_socket.pop(id(websocket), None)
+        if conn is None:
+            return
+
+        # 索引から削除（空になったルーム・ユーザは索引ごと削除）
+        connections = self.rooms.get(conn.room_id)
+        if connections is not None:
+            connections.discard(conn)
+            if not connections:
+                del self.rooms[conn.room_id]
+
+        user_connections = self._by_user.get(conn.user_id)
+        if user_connections is not None:
+            user_connections.discard(conn)
+            if not user_connections:
+                del self._by_user[conn.user_id]
+
+        if conn.task is not asyncio.current_task():
+            conn.task.cancel()
+
+    def touch(self, websocket: WebSocket):
+        """
+        クライアントからの受信時刻を更新（受信のたびに呼ぶ）
+        """
+        conn = self._by_socket.get(id(websocket))
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+
+    def mark_ready(self, websocket: WebSocket):
+        """
+        保留していた配信の送信を開始
+        """
+        conn = self._by_socket.get(id(websocket))
+        if conn is not None:
+            conn.ready.set()
+
+    def get_user_connections(self, user_id: str) -> Set[Connection]:
+        """
+        指定したユーザの接続（複数端末分）を取得
+            Args:
+                user_id: ユーザID
+            Returns:
+                Set: ユーザの接続の集合
+        """
+        return set(self._by_user.get(user_id, ()))
+
+    async def broadcast(self, room_id: str, data: Dict):
+        """
+        ルームに接続している全員（他のワーカーを含む）へ配信
+            Args:
+                room_id: ルームID
+                data: 送信データ
+        """
+        # 送信データのJSON変換は1回だけ行い、全接続で同じ文字列を使い回す
+        frame = serializer.dumps(data)
+
+        # 自プロセスの接続へは直接配信し、他のワーカーへはPub/Sub経由で配信
+        self._deliver(room_id, frame)
+        await self.backend.publish(room_id, frame)
+
+    def send_personal(self, websocket: WebSocket, data: Dict):
+        """
+        指定した接続のみへ送信（送信キュー経由）
+            Args:
+                websocket: 送信先の接続
+                data: 送信データ
+        """
+        conn = self._by_socket.get(id(websocket))
+        if conn is not None:
+            self._enqueue(conn, serializer.dumps(data))
+
+    def _deliver(self, room_id: str, frame: str):
+        """
+        自プロセスでルームに接続している全員へ配信
+        """
+        connections = self.rooms.get(room_id)
+        if not connections:
+            return
+
+        # 送信キューへ積むだけ（遅い接続を待たない）
+        for conn in list(connections):
+            self._enqueue(conn, frame)
+
+    def get_stats(self) -> Dict:
+        """
+        接続数と配信状況のカウンタを取得
+        """
+        return {
+            "rooms": len(self.rooms),
+            "live": len(self._by_socket),
+            "users": len(self._by_user),
+            "pubsub": self.backend.get_stats(),
+            **self.stats,
+        }
+
+    def _enqueue(self, conn: Connection, frame: str):
+        """
+        接続の送信キューへメッセージを積む
+        キューが溢れた場合は設定に応じて破棄または切断する
+        """
+        try:
+            conn.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if self.overflow == OVERFLOW_DISCONNECT:
+                self.stats["slow_disconnected"] += 1
+                log.info(
+                    f"ConnectionManager: 受信が遅いため切断しました ({conn.user_id} - {conn.user_name})"
+                )
+                self.disconnect(conn.websocket)
+                self._close_later(conn.websocket)
+
+    async def _sender(self, conn: Connection):
+        """
+        接続ごとの送信タスク
+        送信キューからメッセージを取り出して順に送信する
+        """
+        websocket = conn.websocket
+        queue = conn.queue
+        await conn.ready.wait()
+        while True:
+            frame = await queue.get()
+            try:
+                await websocket.send_text(frame)
+                self.stats["sent"] += 1
+            except Exception:
+                # 送信に失敗した接続は以降の配信対象から外して切断
+                self.stats["send_failed"] += 1
+                self.disconnect(websocket)
+                await self._close(websocket)
+                return
+
+    async def _reaper(self):
+        """
+        死活監視タスク
+            ・一定時間受信が無い接続へpingを送信
+            ・idle_timeout 秒を超えて受信が無い接続は切断
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for conn in list(self._by_socket.values()):
+                idle = now - conn.last_seen
+                if idle >= self.idle_timeout:
+                    self.stats["reaped_idle"] += 1
+                    log.info(
+                        f"ConnectionManager: 無通信のため切断しました ({conn.user_id} - {conn.user_name})"
+                    )
+                    self.disconnect(conn.websocket)
+                    self._close_later(conn.websocket, CLOSE_CODE_IDLE_TIMEOUT)
+                elif idle >= self.heartbeat_interval:
+                    self.stats["pings"] += 1
+                    self._enqueue(conn, PING_FRAME)
+
+    def _close_later(self, websocket: WebSocket, code: int = CLOSE_CODE_SLOW_CONSUMER):
+        """
+        接続のクローズをバックグラウンドで実行（完了までタスクの参照を保持する）
+        """
+        task = asyncio.create_task(self._close(websocket, code))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    async def _close(self, websocket: WebSocket, code: int = CLOSE_CODE_SLOW_CONSUMER):
+        """
+        接続をクローズ（既に切断済みの場合は何もしない）
+        """
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+
+# 接続管理のインスタンス（環境変数で設定値を上書き可能）
+manager = ConnectionManager(
+    queue_size=env_int("CHAT_SEND_QUEUE_SIZE", 100),
+    overflow=env_str("CHAT_SEND_OVERFLOW", OVERFLOW_DISCONNECT),
+    backend=create_backend(
+        env_str("CHAT_PUBSUB_BACKEND", "memory"),
+        channel=env_str("CHAT_PUBSUB_CHANNEL", "chatter_room"),
+    ),
+    heartbeat_interval=env_float("CHAT_HEARTBEAT_INTERVAL_SEC", 30),
+    idle_timeout=env_float("CHAT_IDLE_TIMEOUT_SEC", 90),
+)
@@ -1,22 +1,29 @@
 import io
-from typing import Sequence, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 from urllib.parse import unquote
 
 import openpyxl
+from sqlalchemy.orm import Session
 
 from api.entities.category import Category
 from api.entities.general import General
 from api.repositories.category import CategoryRepo
-from api.repositories.general import GeneralRepo
+from api.repositories.general import LIST_KEYS, GeneralRepo
+from api.services.permission import AUTHORITY_CATEGORY, permission_matcher
 from api.std import func
+from api.std.paging import page_cursors
 
 
-def get_general(p_code: int, p_category: str) -> General:
+def get_general(
+    p_code: int, p_category: str, session: Optional[Session] = None
+) -> General:
     """
     汎用マスタ情報取得
+    画面の入力値で書き換えて使用するため、セッションから切り離して返す
         Args:
             p_code: 汎用マスタコード
             p_category: 値
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             general: 取得した汎用マスタ情報
     """
@@ -25,23 +32,29 @@ def get_general(p_code: int, p_category: str) -> General:
     if p_code == -1:
         return General()
     else:
-        general_repo = GeneralRepo()
-        return general_repo.find_by_code(p_code, p_category)
+        general_repo = GeneralRepo(session)
+        return general_repo.detach(general_repo.find_by_code(p_code, p_category))
 
 
-def get_select_list() -> Sequence[Category]:
+def get_select_list(session: Optional[Session] = None) -> Sequence[Category]:
     """
     汎用マスタ情報一覧取得処理
     Args:
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
     Returns:
         Sequence: 検索結果のリスト
     """
-    category_repo = CategoryRepo()
+    category_repo = CategoryRepo(session)
     return category_repo.list()
 
 
 def search_general_list(
-    sel_category: str, txt_code_value: str, offset: int, limit: int
+    sel_category: str,
+    txt_code_value: str,
+    offset: int,
+    limit: int,
+    session: Optional[Session] = None,
+    cursor: Optional[str] = None,
 ) -> Tuple[Sequence[General], int]:
     """
     汎用マスタ一覧取得処理
@@ -50,40 +63,58 @@ def search_general_list(
         txt_code_value: 名称（部分一致）
         offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
         limit: 何件取得するか指定
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        cursor: 前後のページのカーソル（指定時は offset を使用しない）
     Returns:
         list: 検索結果のリスト
         int: レコード件数
 
     """
-    general_repo = GeneralRepo()
-    return general_repo.find_list(sel_category, txt_code_value, offset, limit)
+    general_repo = GeneralRepo(session)
+    return general_repo.find_list(sel_category, txt_code_value, offset, limit, cursor)
 
 
-def create_general(general: General) -> int:
+def get_list_cursors(general_list: Sequence[General]) -> Dict[str, str]:
+    """
+    一覧の前後のページを取得するカーソル
+        Args:
+            general_list: 表示中のページの汎用マスタ情報のリスト
+        Returns:
+            dict: 前ページ（prev）・次ページ（next）のカーソル
+    """
+    return page_cursors(general_list, LIST_KEYS)
+
+
+def create_general(general: General, session: Optional[Session] = None) -> int:
     """
     汎用マスタ情報 新規登録
         Args:
             general: 登録する汎用マスタ情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             int: 登録したレコードのID
     """
 
-    general_repo = GeneralRepo()
-    return general_repo.create(general)
+    general_repo = GeneralRepo(session)
+    code = general_repo.create(general)
+    _reload_permission(general, session)
+    return code
 
 
-def update_general(general: General) -> General:
+def update_general(general: General, session: Optional[Session] = None) -> General:
     """
     機種情報 更新
         Args:
             general: 更新する汎用マスタ情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             general: 取得した汎用マスタ情報
 
     """
 
-    general_repo = GeneralRepo()
+    general_repo = GeneralRepo(session)
     general_repo.update(general)
+    _reload_permission(general, session)
     return general_repo.find_by_code(general.code, general.category)
 
 
@@ -154,13 +185,22 @@ def set_search_decode(sel_category: str, txt_code_value: str) -> Tuple[str, str]
     return unquote(sel_category), unquote(txt_code_value)
 
 
-def duplicate_check(general: General) -> bool:
+def duplicate_check(general: General, session: Optional[Session] = None) -> bool:
     """
     同カテゴリ内の同一の名称の有無のチェック
     Args:
         重複チェック対象の汎用関連情報
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
     Returns:
         bool: m_general内の重複データ有無の結果（重複データが0件の場合はtrue）
     """
-    general_repo = GeneralRepo()
+    general_repo = GeneralRepo(session)
     return general_repo.duplicate_check(general)
+
+
+def _reload_permission(general: General, session: Optional[Session]):
+    """
+    権限コードを変更した場合、コミット後に権限管理テーブルを読み直す
+    """
+    if general.category == AUTHORITY_CATEGORY:
+        permission_matcher.reload_on_commit(session)
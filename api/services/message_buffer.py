@@ -0,0 +1,226 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from api.std.env import env_int, env_str
+
+"""
+    message_buffer.py
+    ルームごとの直近メッセージをメモリ上に保持するリングバッファ
+    チャット画面の初期表示をDBへ問い合わせずに返すために使用する
+"""
+
+# メッセージ1件あたりのメモリ使用量の見積り（本文以外の辞書・日時などの分）
+ENTRY_OVERHEAD_BYTES = 400
+
+
+class RoomBuffer:
+    """
+    RoomBuffer
+    1ルーム分の直近メッセージ（ID昇順）
+    """
+
+    __slots__ = ("messages", "anchored", "complete", "size")
+
+    def __init__(self, room_size: int):
+        self.messages: deque = deque(maxlen=room_size)
+        # DBの最新ページと突き合わせ済み（=末尾が連続した履歴になっている）か
+        self.anchored = False
+        # ルームの全履歴を保持しているか（これより古いメッセージが無い）
+        self.complete = False
+        # メモリ使用量の見積り
+        self.size = 0
+
+
+class MessageBuffer:
+    """
+    MessageBuffer
+    ルームごとの直近メッセージを保持するクラス
+        ・メッセージ登録完了時に追加（MessageWriterの通知先として登録する）
+        ・初回参照時はDBから取得した最新ページで補完（それまではDBへフォールバック）
+        ・全体のメモリ使用量が上限を超えたら、最も長く使われていないルームから破棄
+    """
+
+    def __init__(
+        self,
+        room_size: int = 100,
+        max_bytes: int = 64 * 1024 * 1024,
+        enabled: bool = True,
+    ):
+        self.room_size = room_size
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        # {room_id: RoomBuffer}（参照・追加のたびに末尾へ移動するLRU）
+        self._rooms: "OrderedDict[int, RoomBuffer]" = OrderedDict()
+        self._bytes = 0
+        # 登録通知（イベントループ）と履歴取得（スレッドプール）の両方から使われるためロックする
+        self._lock = threading.Lock()
+
+        self.stats = {"hits": 0, "misses": 0, "evicted_rooms": 0}
+
+    def append(self, messages: List[Dict]):
+        """
+        登録が完了したメッセージを追加（MessageWriterの通知先）
+            Args:
+                messages: 登録したメッセージのリスト
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            for message in messages:
+                room = self._get_or_create(message["room_id"])
+                self._push(room, self._to_entry(message))
+            self._evict()
+
+    def seed(self, room_id: int, messages: Sequence[Dict], has_more: bool):
+        """
+        DBから取得した最新ページでバッファを補完
+            Args:
+                room_id: ルームID
+                messages: DBから取得した最新のメッセージ（ID昇順）
+                has_more: これより古いメッセージの有無
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            room = self._get_or_create(room_id)
+            if room.anchored:
+                return
+
+            # 取得中に登録されたメッセージと突き合わせて、IDの重複を除いて並べ直す
+            merged = {m["id"]: m for m in messages}
+            for m in room.messages:
+                merged[m["id"]] = m
+            entries = [merged[k] for k in sorted(merged)]
+
+            self._bytes -= room.size
+            room.messages.clear()
+            room.size = 0
+            for entry in entries:
+                self._push(room, entry)
+
+            room.anchored = True
+            room.complete = not has_more and len(entries) <= self.room_size
+            self._evict()
+
+    def get(
+        self,
+        room_id: int,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> Optional[Tuple[List[Dict], bool]]:
+        """
+        バッファからメッセージ履歴を取得（引数・戻り値は RoomRepo.find_messages と同じ）
+        バッファで応えられない場合（未補完・範囲外）は None を返す
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or not room.anchored:
+                self.stats["misses"] += 1
+                return None
+
+            self._rooms.move_to_end(room_id)
+            messages = list(room.messages)
+            oldest_id = messages[0]["id"] if messages else None
+
+            if after_id is not None:
+                # 指定IDの直後からバッファに揃っている場合のみ
+                if not room.complete and (oldest_id is None or after_id < oldest_id):
+                    self.stats["misses"] += 1
+                    return None
+                newer = [m for m in messages if m["id"] > after_id]
+                self.stats["hits"] += 1
+                return newer[:limit], len(newer) > limit
+
+            if before_id is not None:
+                messages = [m for m in messages if m["id"] < before_id]
+
+            if len(messages) > limit:
+                self.stats["hits"] += 1
+                return messages[-limit:], True
+            if room.complete:
+                self.stats["hits"] += 1
+                return messages, False
+
+            self.stats["misses"] += 1
+            return None
+
+    def get_stats(self) -> Dict:
+        """
+        保持状況と参照結果のカウンタを取得
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rooms": len(self._rooms),
+                "messages": sum(len(r.messages) for r in self._rooms.values()),
+                "bytes": self._bytes,
+                **self.stats,
+            }
+
+    def _get_or_create(self, room_id: int) -> RoomBuffer:
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = RoomBuffer(self.room_size)
+            self._rooms[room_id] = room
+        else:
+            self._rooms.move_to_end(room_id)
+        return room
+
+    def _push(self, room: RoomBuffer, entry: Dict):
+        """
+        メッセージを末尾へ追加（上限を超えた分は先頭から押し出される）
+        """
+        if len(room.messages) == room.messages.maxlen:
+            dropped = room.messages[0]
+            room.size -= self._entry_size(dropped)
+            self._bytes -= self._entry_size(dropped)
+            # 押し出した時点で全履歴ではなくなる
+            room.complete = False
+
+        room.messages.append(entry)
+        room.size += self._entry_size(entry)
+        self._bytes += self._entry_size(entry)
+
+    def _evict(self):
+        """
+        メモリ使用量が上限を超えている間、最も長く使われていないルームを破棄
+        """
+        while self._bytes > self.max_bytes and self._rooms:
+            _, room = self._rooms.popitem(last=False)
+            self._bytes -= room.size
+            self.stats["evicted_rooms"] += 1
+
+    @staticmethod
+    def _to_entry(message: Dict) -> Dict:
+        """
+        履歴APIと同じ形式の辞書へ変換
+        """
+        return {
+            "id": message["id"],
+            "user_id": message["user_id"],
+            "user_name": message["user_name"],
+            "message": message["message"],
+            "client_msg_id": message["client_msg_id"],
+            "create_date": message["create_date"],
+        }
+
+    @staticmethod
+    def _entry_size(entry: Dict) -> int:
+        return len(entry["message"]) * 4 + ENTRY_OVERHEAD_BYTES
+
+
+# 直近メッセージのバッファ（環境変数で設定値を上書き可能）
+#   ワーカー間配信（postgres）を使う場合は他ワーカーのメッセージが入らないため無効にする
+history_buffer = MessageBuffer(
+    room_size=env_int("CHAT_HISTORY_BUFFER_SIZE", 100),
+    max_bytes=env_int("CHAT_HISTORY_BUFFER_MAX_MB", 64) * 1024 * 1024,
+    enabled=env_str("CHAT_PUBSUB_BACKEND", "memory") == "memory",
+)
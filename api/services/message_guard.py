@@ -0,0 +1,116 @@
+from typing import Dict, Optional
+
+from api.entities.room_message import RoomMessage
+from api.std.env import env_float, env_int
+from api.std.ratelimit import RateLimiter
+
+"""
+    message_guard.py
+    チャットメッセージ受信時の入力チェックと流量制限
+    DBへ登録する前に、安価な判定だけで不正・過剰なメッセージを弾く
+"""
+
+# 判定結果（拒否理由）
+REJECT_INVALID = "invalid"
+REJECT_EMPTY = "empty"
+REJECT_TOO_LONG = "too_long"
+REJECT_USER_RATE = "user_rate_limited"
+REJECT_ROOM_RATE = "room_rate_limited"
+
+# メッセージの最大文字数（登録先の列定義に合わせる）
+MESSAGE_MAX_LEN = RoomMessage.__table__.c.message.type.length
+
+
+class MessageGuard:
+    """
+    MessageGuard
+    受信メッセージの入力チェックと、ユーザ単位・ルーム単位の流量制限を行うクラス
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 5,
+        user_burst: float = 10,
+        room_rate: float = 50,
+        room_burst: float = 100,
+        max_frame_bytes: int = 16 * 1024,
+    ):
+        self.user_limiter = RateLimiter(user_rate, user_burst)
+        self.room_limiter = RateLimiter(room_rate, room_burst)
+        self.max_frame_bytes = max_frame_bytes
+
+        # 判定結果のカウンタ
+        self.stats = {
+            "accepted": 0,
+            REJECT_INVALID: 0,
+            REJECT_EMPTY: 0,
+            REJECT_TOO_LONG: 0,
+            REJECT_USER_RATE: 0,
+            REJECT_ROOM_RATE: 0,
+        }
+
+    def check_frame(self, text: str) -> Optional[str]:
+        """
+        受信データ（解析前）のサイズチェック
+            Args:
+                text: 受信データ
+            Returns:
+                str: 拒否理由（問題無い場合はNone）
+        """
+        # 1文字は最大4バイトのため、文字数で足りる場合はエンコードしない
+        if len(text) * 4 > self.max_frame_bytes and (
+            len(text.encode()) > self.max_frame_bytes
+        ):
+            return self._reject(REJECT_TOO_LONG)
+        return None
+
+    def check_message(self, room_id: str, user_id: str, message) -> Optional[str]:
+        """
+        メッセージの入力チェックと流量制限
+            Args:
+                room_id: ルームID
+                user_id: 送信者のユーザID
+                message: メッセージ
+            Returns:
+                str: 拒否理由（問題無い場合はNone）
+        """
+        if not isinstance(message, str):
+            return self._reject(REJECT_INVALID)
+        if not message.strip():
+            return self._reject(REJECT_EMPTY)
+        if len(message) > MESSAGE_MAX_LEN:
+            return self._reject(REJECT_TOO_LONG)
+
+        # 共有のルームの枠を先に確かめ、ルームで拒否した場合はユーザの枠を消費しない
+        if not self.room_limiter.peek(room_id):
+            return self._reject(REJECT_ROOM_RATE)
+        if not self.user_limiter.allow(user_id):
+            return self._reject(REJECT_USER_RATE)
+        self.room_limiter.allow(room_id)
+
+        self.stats["accepted"] += 1
+        return None
+
+    def get_stats(self) -> Dict:
+        """
+        判定結果のカウンタと流量制限の設定を取得
+        """
+        return {
+            "user_limit": self.user_limiter.get_stats(),
+            "room_limit": self.room_limiter.get_stats(),
+            **self.stats,
+        }
+
+    def _reject(self, reason: str) -> str:
+        self.stats[reason] += 1
+        return reason
+
+
+# 受信メッセージのチェック処理（環境変数で設定値を上書き可能）
+guard = MessageGuard(
+    user_rate=env_float("CHAT_RATE_USER_PER_SEC", 5),
+    user_burst=env_float("CHAT_RATE_USER_BURST", 10),
+    room_rate=env_float("CHAT_RATE_ROOM_PER_SEC", 50),
+    room_burst=env_float("CHAT_RATE_ROOM_BURST", 100),
+    max_frame_bytes=env_int("CHAT_MAX_FRAME_BYTES", 16384),
+)
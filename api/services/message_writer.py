@@ -0,0 +1,275 @@
+import asyncio
+import inspect
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from api.services import room as s_room
+from api.std.env import env_int
+from api.std.logging import log
+
+"""
+    message_writer.py
+    チャットメッセージの遅延一括登録（write-behind）処理
+"""
+
+# 登録完了時の通知先の型 : listener(登録したメッセージのリスト)
+#   各メッセージは id, room_id, user_id, user_name, message, client_msg_id, create_date を持つ辞書
+#   非同期関数（コルーチン関数）も指定可能
+#   登録失敗時の通知先も同じ型（id, create_date を持たない辞書のリストを受け取る）
+Listener = Callable[[List[Dict]], Union[None, Awaitable[None]]]
+
+# 登録に失敗したことを送信者へ通知する際の理由
+REJECT_NOT_PERSISTED = "not_persisted"
+
+
+class MessageWriter:
+    """
+    MessageWriter
+    受信したメッセージをキューに溜め、バックグラウンドで一括登録するクラス
+        ・件数（batch_size）か経過時間（flush_interval）のどちらかに達した時点で登録
+        ・1回の登録は複数行INSERT 1回で実施
+        ・登録に失敗した場合は間隔を延ばしながら max_retries 回まで再試行し、
+          それでも失敗した場合は登録失敗時の通知先へ通知する
+          （再試行で二重に登録されないよう、DB側で登録済みのものは読み飛ばす）
+        ・直近に受け付けたクライアントメッセージIDを保持し、再送されたメッセージは受け付けない
+          （登録に失敗したメッセージは保持から外し、再送を受け付ける）
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_queue: int = 10000,
+        dedupe_size: int = 10000,
+        max_retries: int = 3,
+        retry_interval: float = 0.5,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dedupe_size = dedupe_size
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        # 直近に受け付けた (user_id, client_msg_id)
+        self._recent: "OrderedDict[tuple, None]" = OrderedDict()
+        self.stats = {
+            "accepted": 0,
+            "duplicated": 0,
+            "persisted": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Listener] = []
+        self._failure_listeners: List[Listener] = []
+
+    def add_listener(self, listener: Listener):
+        """
+        登録完了時の通知先を追加
+            Args:
+                listener: 登録したメッセージのリストを受け取る関数
+        """
+        self._listeners.append(listener)
+
+    def add_failure_listener(self, listener: Listener):
+        """
+        登録失敗時（再試行しても登録できなかった場合）の通知先を追加
+            Args:
+                listener: 登録できなかったメッセージのリストを受け取る関数
+        """
+        self._failure_listeners.append(listener)
+
+    async def start(self):
+        """
+        バックグラウンドの登録タスクを開始
+        """
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        キューに残っているメッセージを全て登録してからタスクを停止
+        """
+        if self._task is None:
+            return
+        # 終了の合図（None）を積んで、それまでのメッセージを登録させる
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def put(
+        self,
+        room_id: int,
+        user_id: int,
+        user_name: str,
+        message: str,
+        client_msg_id: Optional[str] = None,
+    ) -> bool:
+        """
+        メッセージを登録キューへ追加
+        キューが満杯の場合は空きが出るまで待機する（DBが詰まった際の流量制御）
+            Args:
+                room_id: ルームID
+                user_id: 送信者のユーザID
+                user_name: 送信者のユーザ名（登録完了の通知用）
+                message: メッセージ
+                client_msg_id: クライアント側で採番したメッセージID（未指定時はサーバで採番）
+            Returns:
+                bool: 受け付けた場合はTrue（再送による重複の場合はFalse）
+        """
+        if client_msg_id is None:
+            client_msg_id = uuid.uuid4().hex
+
+        # 再送されたメッセージは受け付けない（DB側も一意制約で重複登録を防ぐ）
+        key = (user_id, client_msg_id)
+        if key in self._recent:
+            self.stats["duplicated"] += 1
+            return False
+        self._recent[key] = None
+        if len(self._recent) > self.dedupe_size:
+            self._recent.popitem(last=False)
+
+        self.stats["accepted"] += 1
+        row = {
+            "room_id": room_id,
+            "user_id": user_id,
+            "user_name": user_name,
+            "message": message,
+            "client_msg_id": client_msg_id,
+        }
+
+        if self._queue is None:
+            # タスク未起動時（起動前・停止後）は即時登録
+            await self._flush([row])
+            return True
+
+        await self._queue.put(row)
+        return True
+
+    def get_stats(self) -> Dict:
+        """
+        受付・登録状況のカウンタを取得
+        """
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            **self.stats,
+        }
+
+    async def _run(self):
+        """
+        キューからメッセージを取り出し、一定件数・一定時間ごとに一括登録する
+        """
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+
+            # 件数か時間のどちらかに達するまで溜める
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]):
+        """
+        溜まったメッセージを一括登録
+            Args:
+                batch: 登録するメッセージのリスト
+        """
+        rows = [
+            {
+                "room_id": row["room_id"],
+                "user_id": row["user_id"],
+                "message": row["message"],
+                "client_msg_id": row["client_msg_id"],
+            }
+            for row in batch
+        ]
+        attempt = 0
+        while True:
+            try:
+                results = await s_room.entry_messages_async(rows)
+                break
+            except Exception as exc:
+                if attempt < self.max_retries:
+                    # DBの一時的な障害に備えて、間隔を延ばしながら再試行
+                    attempt += 1
+                    self.stats["retried"] += 1
+                    log.warning(
+                        f"MessageWriter: {len(batch)}件のメッセージ登録を再試行します"
+                        f" ({attempt}/{self.max_retries}): {exc}"
+                    )
+                    await asyncio.sleep(self.retry_interval * 2 ** (attempt - 1))
+                    continue
+
+                # 登録に失敗しても後続のメッセージ処理は継続する
+                self.stats["failed"] += len(batch)
+                log.error(
+                    f"MessageWriter: {len(batch)}件のメッセージ登録に失敗しました: {exc}"
+                )
+                # 登録できなかったメッセージは、クライアントからの再送を受け付ける
+                for row in batch:
+                    self._recent.pop((row["user_id"], row["client_msg_id"]), None)
+                await self._notify(self._failure_listeners, batch)
+                return
+
+        # 採番されたIDと登録日時を付与して通知（登録済みで読み飛ばされたものは除く）
+        registered = {(r.user_id, r.client_msg_id): r for r in results}
+        persisted = []
+        for row in batch:
+            result = registered.get((row["user_id"], row["client_msg_id"]))
+            if result is None:
+                continue
+            row["id"] = result.id
+            row["create_date"] = result.create_date
+            persisted.append(row)
+
+        self.stats["persisted"] += len(persisted)
+        if not persisted:
+            return
+
+        await self._notify(self._listeners, persisted)
+
+    async def _notify(self, listeners: List[Listener], messages: List[Dict]):
+        """
+        通知先へメッセージのリストを通知（通知先の例外は後続の処理へ影響させない）
+        """
+        for listener in listeners:
+            try:
+                result = listener(messages)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as exc:
+                log.error(f"MessageWriter: 登録結果の通知に失敗しました: {exc}")
+
+
+# メッセージ登録処理のインスタンス（環境変数で設定値を上書き可能）
+writer = MessageWriter(
+    batch_size=env_int("CHAT_WRITE_BATCH_SIZE", 500),
+    flush_interval=env_int("CHAT_WRITE_FLUSH_INTERVAL_MS", 50) / 1000,
+    max_queue=env_int("CHAT_WRITE_QUEUE_MAX", 10000),
+    dedupe_size=env_int("CHAT_DEDUPE_SIZE", 10000),
+    max_retries=env_int("CHAT_WRITE_RETRY_MAX", 3),
+    retry_interval=env_int("CHAT_WRITE_RETRY_INTERVAL_MS", 500) / 1000,
+)
@@ -1,13 +1,30 @@
+import functools
 import re
+import threading
+import time
+from typing import Dict, List, Optional, Pattern, Sequence
 
 from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
+from api.entities.general import General
 from api.entities.user import User
+from api.repositories.general import GeneralRepo
+from api.std.env import env_float, env_int
+from api.std.logging import log
 from exceptions import NotPermittedException
 
+# 権限コードを管理する汎用マスタのカテゴリ
+#   予備テキスト01に、その権限でアクセス可能なパス(正規表現)を空白・改行区切りで設定する
+AUTHORITY_CATEGORY = "authority_code"
+
+# コミット後に権限テーブルを読み直すことを表すセッションの info のキー
+RELOAD_KEY = "permission_reload"
+
 
 def create_path_table():
-    """権限管理テーブルを作成する
+    """権限管理テーブルを作成する（汎用マスタにパスが未設定の場合の既定値）
 
     Returns:
         dict : 権限コードがキーで、その権限を持つ人がアクセス可能なパス(正規表現)のリストを値にする辞書
@@ -32,8 +49,163 @@ def create_path_table():
     }
 
 
-# 権限テーブル作成実施
-path_table = create_path_table()
+def load_path_table(authorities: Sequence[General]) -> Dict[int, List[str]]:
+    """汎用マスタの権限コードから権限管理テーブルを作成する
+
+    Args:
+        authorities (Sequence[General]): 汎用マスタの権限コードのリスト
+
+    Returns:
+        dict : create_path_table と同じ形式の辞書（予備テキスト01を設定した権限のみ既定値を置き換える）
+    """
+    # 削除・未設定の権限は既定値のまま（管理者の行を削除しても管理画面へ入れるようにする）
+    path_table = create_path_table()
+    for authority in authorities:
+        paths = (authority.code_reserve01_text or "").split()
+        if paths:
+            path_table[authority.code] = paths
+    return path_table
+
+
+def _is_valid_path(authority_code: int, path: str) -> bool:
+    """正規表現として正しいパスかどうかを判定する（不正な場合はログに出力する）"""
+    try:
+        re.compile(path)
+    except re.error as exc:
+        log.warning(
+            f"権限コード{authority_code}の不正なパスを読み飛ばしました: {path} ({exc})"
+        )
+        return False
+    return True
+
+
+class PermissionMatcher:
+    """
+    PermissionMatcher
+    権限コードごとのパスを1つの正規表現にまとめて判定し、判定結果をキャッシュするクラス
+        ・判定結果は (世代, 権限コード, パス) をキーに cache_size 件までLRUで保持
+        ・権限管理テーブルを読み直すと世代が変わり、以前の判定結果は使われなくなる
+        ・reload_interval 秒ごと（0以下の場合は変更時のみ）に汎用マスタから読み直す
+    """
+
+    def __init__(
+        self,
+        path_table: Dict[int, List[str]],
+        cache_size: int = 10000,
+        reload_interval: float = 60,
+    ):
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self._patterns: Dict[int, Pattern] = {}
+        self._generation = 0
+        self._is_allowed = functools.lru_cache(maxsize=cache_size)(self._match)
+        # 初回の判定時に汎用マスタから読み込む
+        self._stale = True
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.compile(path_table)
+
+    def compile(self, path_table: Dict[int, List[str]]):
+        """権限管理テーブルを正規表現にまとめて、判定に使用するテーブルを置き換える
+
+        不正な正規表現のパスはログに出力して読み飛ばす
+
+        Args:
+            path_table (dict): create_path_table と同じ形式の辞書
+
+        Raises:
+            re.error: パスを1つの正規表現にまとめられない場合（判定に使用するテーブルは変更しない）
+        """
+        patterns = {}
+        for code, paths in path_table.items():
+            valid_paths = [path for path in paths if _is_valid_path(code, path)]
+            if valid_paths:
+                patterns[code] = re.compile(
+                    "|".join(f"(?:{path})" for path in valid_paths)
+                )
+        with self._lock:
+            self._patterns = patterns
+            self._generation += 1
+
+    def is_allowed(self, authority_code: int, path: str) -> bool:
+        """指定された権限でパスにアクセスできるかどうかを判定する
+
+        Args:
+            authority_code (int): 権限コード
+            path (str): リクエストされたパス
+
+        Returns:
+            bool : アクセスできる場合はTrue（未登録の権限コードはFalse）
+        """
+        return self._is_allowed(self._generation, authority_code, path)
+
+    def mark_stale(self):
+        """次回の判定時に汎用マスタから読み直す"""
+        self._stale = True
+
+    def claim_reload(self) -> bool:
+        """汎用マスタからの読み直しが必要かどうかを判定する
+
+        同時に複数のリクエストが読み直さないよう、Trueを返すのは1回だけ
+
+        Returns:
+            bool : 読み直しが必要な場合はTrue
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = (
+                self.reload_interval > 0
+                and now - self._loaded_at >= self.reload_interval
+            )
+            if not (self._stale or expired):
+                return False
+            self._stale = False
+            self._loaded_at = now
+            return True
+
+    def reload_on_commit(self, session: Optional[Session]):
+        """権限コードの変更をコミットした後に、汎用マスタから読み直す
+
+        Args:
+            session (Session): 変更を行ったセッション（未指定時は変更済みとして扱う）
+        """
+        if session is None:
+            self.mark_stale()
+        else:
+            session.info[RELOAD_KEY] = True
+
+    def get_stats(self) -> Dict:
+        """判定結果のキャッシュの件数と参照結果のカウンタを取得する"""
+        info = self._is_allowed.cache_info()
+        return {
+            "authority_codes": sorted(self._patterns),
+            "cache_size": self.cache_size,
+            "entries": info.currsize,
+            "hits": info.hits,
+            "misses": info.misses,
+        }
+
+    def _match(self, generation: int, authority_code: int, path: str) -> bool:
+        pattern = self._patterns.get(authority_code)
+        return pattern is not None and pattern.match(path) is not None
+
+
+# 権限テーブル作成実施（環境変数で設定値を上書き可能）
+permission_matcher = PermissionMatcher(
+    create_path_table(),
+    cache_size=env_int("PERMISSION_CACHE_SIZE", 10000),
+    reload_interval=env_float("PERMISSION_RELOAD_SEC", 60),
+)
+
+
+def reload_path_table(session: Optional[Session] = None):
+    """汎用マスタから権限管理テーブルを読み直す
+
+    Args:
+        session (Session): リクエスト単位のセッション（未指定時は処理ごとに作成）
+    """
+    general_repo = GeneralRepo(session)
+    permission_matcher.compile(load_path_table(general_repo.find(AUTHORITY_CATEGORY)))
 
 
 def check_permission(request: Request, user: User):
@@ -46,8 +218,24 @@ def check_permission(request: Request, user: User):
     Raises:
         NotPermittedException: アクセスできない場合にスローされる例外
     """
-    paths = path_table.get(user.authority_code)
-    for path in paths:
-        if re.match(path, request.url.path):
-            return
-    raise NotPermittedException()
+    if permission_matcher.claim_reload():
+        try:
+            # リクエストのトランザクションへ影響させないよう、別のセッションで読み直す
+            reload_path_table()
+        except Exception as exc:
+            # 読み直せなかった場合はそれまでのテーブルで判定し、次の間隔で再度読み直す
+            log.error(f"権限管理テーブルの読み直しに失敗しました: {exc}")
+
+    if not permission_matcher.is_allowed(user.authority_code, request.url.path):
+        raise NotPermittedException()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    if session.info.pop(RELOAD_KEY, False):
+        permission_matcher.mark_stale()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(RELOAD_KEY, None)
@@ -0,0 +1,253 @@
+import asyncio
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from api.std import serializer, sql
+from api.std.logging import log
+
+"""
+    pubsub.py
+    ルーム配信をプロセス（ワーカー）間で共有するためのPub/Sub処理
+"""
+
+# 配信先（ローカル接続への配信処理）の型 : deliver(room_id, frame)
+#   frame はJSON変換済みの送信データ
+Deliver = Callable[[str, str], None]
+
+# NOTIFYのペイロード上限（PostgreSQLの既定値は8000バイト未満）
+NOTIFY_PAYLOAD_MAX = 7999
+
+
+class InProcessBackend:
+    """
+    InProcessBackend
+    プロセス内のみで配信するPub/Sub（ワーカー1つの場合の既定値）
+    ローカル接続への配信はConnectionManager側で行うため、ここでは何もしない
+    """
+
+    async def start(self, deliver: Deliver):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, room_id: str, frame: str):
+        pass
+
+    def get_stats(self) -> Dict:
+        return {"backend": "memory"}
+
+
+class PostgresBackend:
+    """
+    PostgresBackend
+    PostgreSQLのLISTEN/NOTIFYを利用して他のワーカーへ配信するPub/Sub
+        ・接続設定は api.std.sql のエンジンをそのまま利用
+        ・送信は一定時間ごとにまとめて1回のSQLで実行
+        ・自プロセスが送信した通知は受信時に読み捨てる（ローカル配信済みのため）
+    """
+
+    def __init__(
+        self,
+        channel: str = "chatter_room",
+        flush_interval: float = 0.02,
+        reconnect_interval: float = 3.0,
+    ):
+        self.channel = channel
+        self.flush_interval = flush_interval
+        self.reconnect_interval = reconnect_interval
+
+        # 自プロセスの識別子（自分の通知を読み捨てるために使う）
+        self.node_id = uuid.uuid4().hex
+        self._seq = 0
+
+        self._deliver: Optional[Deliver] = None
+        self._outgoing: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._listen_task: Optional[asyncio.Task] = None
+        self._listen_conn = None
+        self._stopping = False
+
+        # 送受信状況のカウンタ
+        self.stats = {
+            "published": 0,
+            "received": 0,
+            "skipped_oversize": 0,
+            "publish_failed": 0,
+        }
+
+    async def start(self, deliver: Deliver):
+        """
+        受信（LISTEN）と送信タスクを開始
+        """
+        self._deliver = deliver
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._listen_task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        """
+        未送信の通知を送信してから停止
+        """
+        self._stopping = True
+        if self._flush_task is not None:
+            self._wakeup.set()
+            await self._flush_task
+            self._flush_task = None
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+        self._close_listen_conn()
+
+    async def publish(self, room_id: str, frame: str):
+        """
+        他のワーカーへの配信を送信待ちに積む
+        """
+        if self._wakeup is None:
+            return
+
+        self._seq += 1
+        payload = serializer.dumps(
+            {"n": self.node_id, "s": self._seq, "r": room_id, "f": frame}
+        )
+        if len(payload.encode()) > NOTIFY_PAYLOAD_MAX:
+            self.stats["skipped_oversize"] += 1
+            log.warning(
+                f"PostgresBackend: ペイロードが大きすぎるため送信しません ({room_id})"
+            )
+            return
+
+        self._outgoing.append(payload)
+        self._wakeup.set()
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": "postgres",
+            "node_id": self.node_id,
+            "listening": self._listen_conn is not None,
+            **self.stats,
+        }
+
+    async def _flush_loop(self):
+        """
+        送信待ちの通知を一定時間ごとにまとめて送信する
+        """
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            # 少し待って同じタイミングの通知をまとめる
+            if not self._stopping:
+                await asyncio.sleep(self.flush_interval)
+
+            if self._outgoing:
+                payloads, self._outgoing = self._outgoing, []
+                try:
+                    await run_in_threadpool(self._notify, payloads)
+                    self.stats["published"] += len(payloads)
+                except Exception as exc:
+                    self.stats["publish_failed"] += len(payloads)
+                    log.error(f"PostgresBackend: 通知の送信に失敗しました: {exc}")
+
+            if self._stopping:
+                return
+
+    def _notify(self, payloads: List[str]):
+        """
+        複数の通知を1回のSQLで送信（コミット時に配信される）
+        """
+        sql.select(
+            "SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload",
+            {"channel": self.channel, "payloads": payloads},
+        )
+
+    async def _listen_loop(self):
+        """
+        通知の受信（切断された場合は一定時間後に再接続）
+        """
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                await run_in_threadpool(self._open_listen_conn)
+                disconnected = loop.create_future()
+                loop.add_reader(
+                    self._listen_conn.fileno(), self._on_readable, disconnected
+                )
+                try:
+                    await disconnected
+                finally:
+                    loop.remove_reader(self._listen_conn.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.error(f"PostgresBackend: LISTEN接続でエラーが発生しました: {exc}")
+
+            self._close_listen_conn()
+            await asyncio.sleep(self.reconnect_interval)
+
+    def _open_listen_conn(self):
+        """
+        LISTEN専用の接続を作成（コネクションプールからは切り離す）
+        """
+        pooled = sql.engine.raw_connection()
+        pooled.detach()
+        conn = pooled.dbapi_connection
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        self._listen_conn = conn
+
+    def _close_listen_conn(self):
+        if self._listen_conn is not None:
+            try:
+                self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    def _on_readable(self, disconnected: asyncio.Future):
+        """
+        受信した通知をローカル接続へ配信する
+        """
+        try:
+            self._listen_conn.poll()
+        except Exception as exc:
+            if not disconnected.done():
+                disconnected.set_exception(exc)
+            return
+
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            try:
+                data = serializer.loads(notify.payload)
+            except ValueError:
+                continue
+
+            # 自プロセスが送信した通知はローカル配信済み
+            if data.get("n") == self.node_id:
+                continue
+
+            self.stats["received"] += 1
+            self._deliver(data["r"], data["f"])
+
+
+def create_backend(name: str, channel: str = "chatter_room"):
+    """
+    設定値からPub/Subを作成
+        Args:
+            name: memory（プロセス内のみ） or postgres（LISTEN/NOTIFY）
+            channel: postgres の場合のチャンネル名
+        Returns:
+            作成したPub/Sub
+    """
+    if name == "postgres":
+        return PostgresBackend(channel=channel)
+    return InProcessBackend()
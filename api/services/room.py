@@ -1,12 +1,18 @@
-from typing import Dict, Optional, Sequence, Tuple
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row
+from sqlalchemy.orm import Session
 
 from api.entities.room import Room
 from api.entities.room_member import RoomMember
-from api.entities.room_message import RoomMessage
 from api.entities.user import User
-from api.repositories.room import RoomRepo
+from api.repositories.room import LIST_KEYS, LOAD_CHAT, AsyncRoomRepo, RoomRepo
 from api.repositories.user import UserRepo
+from api.services.message_buffer import history_buffer
 from api.std import func
+from api.std.paging import page_cursors
+from api.std.routing import use_primary
 
 
 def find_rooms(
@@ -14,6 +20,8 @@ def find_rooms(
     member_id: Optional[id] = None,
     offset: int = 0,
     limit: int = 10,
+    session: Optional[Session] = None,
+    cursor: Optional[str] = None,
 ) -> Tuple[Sequence[Room], int]:
     """
     ルーム情報一覧取得処理
@@ -22,19 +30,34 @@ def find_rooms(
         member_name: メンバー名（部分一致）
         offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
         limit: 何件取得するか指定
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        cursor: 前後のページのカーソル（指定時は offset を使用しない）
     Returns:
         list: 検索結果のリスト
         int: レコード件数
     """
-    room_repo = RoomRepo()
-    return room_repo.find_list(room_name, member_id, offset, limit)
+    room_repo = RoomRepo(session)
+    return room_repo.find_list(room_name, member_id, offset, limit, cursor)
 
 
-def get_room(id: int) -> Room:
+def get_list_cursors(room_list: Sequence[Room]) -> Dict[str, str]:
+    """
+    一覧の前後のページを取得するカーソル
+        Args:
+            room_list: 表示中のページのルーム情報のリスト
+        Returns:
+            dict: 前ページ（prev）・次ページ（next）のカーソル
+    """
+    return page_cursors(room_list, LIST_KEYS)
+
+
+def get_room(id: int, session: Optional[Session] = None) -> Room:
     """
     ルーム情報取得
+    画面の入力値で書き換えて使用するため、セッションから切り離して返す
         Args:
             id: ユーザID
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             Room: 取得したルーム情報
     """
@@ -43,20 +66,100 @@ def get_room(id: int) -> Room:
     if id == 0:
         return Room()
     else:
-        room_repo = RoomRepo()
-        return room_repo.find_by_id(id)
+        room_repo = RoomRepo(session)
+        return room_repo.detach(room_repo.find_by_id(id))
+
+
+def get_chat_room(id: int, session: Optional[Session] = None) -> Room:
+    """
+    チャット画面用のルーム情報取得（メンバー・メッセージは読み込まない）
+        Args:
+            id: ルームID
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        Returns:
+            Room: 取得したルーム情報
+    """
 
+    if id == 0:
+        return Room()
+    return RoomRepo(session).find_by_id(id, LOAD_CHAT)
 
-def get_member_by_mail(mail_address: str) -> User:
+
+def find_messages(
+    room_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict], bool]:
+    """
+    メッセージ履歴取得処理
+        Args:
+            room_id: ルームID
+            before_id: 指定したIDより前（古い）のメッセージを取得
+            after_id: 指定したIDより後（新しい）のメッセージを取得
+            limit: 何件取得するか指定
+        Returns:
+            list: メッセージのリスト（ID昇順）
+            bool: 続きのメッセージ有無
+    """
+    # 直近のメッセージはメモリ上のバッファから返す
+    buffered = history_buffer.get(room_id, before_id, after_id, limit)
+    if buffered is not None:
+        return buffered
+
+    room_repo = RoomRepo()
+    # 差分取得（再接続時）はレプリカの遅延で取りこぼさないようプライマリを参照
+    with _route_for(after_id):
+        rows, has_more = room_repo.find_messages(room_id, before_id, after_id, limit)
+    messages = [row._asdict() for row in rows]
+
+    # 最新ページを取得した場合はバッファを補完
+    if before_id is None and after_id is None:
+        history_buffer.seed(room_id, messages, has_more)
+
+    return messages, has_more
+
+
+async def find_messages_async(
+    room_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict], bool]:
+    """
+    メッセージ履歴取得処理（非同期版、引数・戻り値は find_messages と同じ）
+    """
+    # 直近のメッセージはメモリ上のバッファから返す
+    buffered = history_buffer.get(room_id, before_id, after_id, limit)
+    if buffered is not None:
+        return buffered
+
+    room_repo = AsyncRoomRepo()
+    # 差分取得（再接続時）はレプリカの遅延で取りこぼさないようプライマリを参照
+    with _route_for(after_id):
+        rows, has_more = await room_repo.find_messages(
+            room_id, before_id, after_id, limit
+        )
+    messages = [row._asdict() for row in rows]
+
+    # 最新ページを取得した場合はバッファを補完
+    if before_id is None and after_id is None:
+        history_buffer.seed(room_id, messages, has_more)
+
+    return messages, has_more
+
+
+def get_member_by_mail(mail_address: str, session: Optional[Session] = None) -> User:
     """
     アドレスからメンバ情報取得
         Args:
             mail_address: メールアドレス
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             User: 取得したメンバ情報
     """
 
-    user_repo = UserRepo()
+    user_repo = UserRepo(session)
     user = user_repo.find_by_address(mail_address)
     if not user:
         user = User()
@@ -69,17 +172,21 @@ def get_member_by_mail(mail_address: str) -> User:
     return user
 
 
-def get_selected_lists(login_user_id: id) -> Dict[str, Sequence[User]]:
+def get_selected_lists(
+    login_user_id: id, session: Optional[Session] = None
+) -> Dict[str, Sequence[User]]:
     """
     画面の選択項目のリスト取得
         Args:
+            login_user_id: ログイン者のユーザID
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
 
         Returns:
             以下のリストを返す辞書
                 member: メンバーリスト
     """
 
-    room_repo = RoomRepo()
+    room_repo = RoomRepo(session)
 
     member_list = room_repo.find_member_in_target_user(login_user_id)
 
@@ -88,55 +195,67 @@ def get_selected_lists(login_user_id: id) -> Dict[str, Sequence[User]]:
     }
 
 
-def create_room(room: Room, members: list) -> Room:
+def create_room(room: Room, members: list, session: Optional[Session] = None) -> Room:
     """
     ルーム情報 新規登録
         Args:
             room: 登録するルーム情報
+            members: 登録するメンバ
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             Room: 登録したルーム情報
     """
 
-    room_repo = RoomRepo()
+    room_repo = RoomRepo(session)
     room_id = room_repo.create(room, members)
     return room_repo.find_by_id(room_id)
 
 
-def update_room(room: Room, members: list) -> Room:
+def update_room(room: Room, members: list, session: Optional[Session] = None) -> Room:
     """
     ルーム情報 更新
         Args:
             room: 更新するルーム情報
+            members: 登録するメンバ
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             room: 更新したルーム情報
 
     """
 
-    room_repo = RoomRepo()
+    room_repo = RoomRepo(session)
     room_repo.update(room, members)
     assert room.id is not None
     return room_repo.find_by_id(room.id)
 
 
-def delete_room(room: Room):
+def delete_room(room: Room, session: Optional[Session] = None):
     """
     ルーム情報 削除
         Args:
             room: 削除するルーム情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
 
     """
-    room_repo = RoomRepo()
+    room_repo = RoomRepo(session)
     room_repo.delete(room)
 
 
-def entry_message(room_message: RoomMessage):
+async def entry_messages_async(room_messages: List[Dict]) -> Sequence[Row]:
     """
-    メッセージ登録
+    メッセージ一括登録
         Args:
-            room_message: メッセージ情報
+            room_messages: メッセージ情報（room_id, user_id, message, client_msg_id）の辞書リスト
         Returns:
+            Sequence: 登録したメッセージの id, create_date, user_id, client_msg_id
+    """
+    room_repo = AsyncRoomRepo()
+    return await room_repo.entry_messages(room_messages)
+
 
+def _route_for(after_id: Optional[int]):
     """
-    room_repo = RoomRepo()
-    room_repo.entry_message(room_message)
+    メッセージ履歴の参照先（差分取得はプライマリ、それ以外はレプリカ）
+    """
+    return use_primary() if after_id is not None else nullcontext()
@@ -3,19 +3,24 @@ from typing import Dict, Optional, Sequence, Tuple
 from urllib.parse import unquote
 
 import openpyxl
+from sqlalchemy.orm import Session
 
 from api.entities.general import General
 from api.entities.user import User
 from api.repositories.general import GeneralRepo
-from api.repositories.user import UserRepo
+from api.repositories.user import LIST_KEYS, UserRepo
 from api.std import func
+from api.std.paging import page_cursors
+from api.std.routing import use_primary
 
 
-def get_user(id: int) -> User:
+def get_user(id: int, session: Optional[Session] = None) -> User:
     """
     ユーザ情報取得
+    画面の入力値で書き換えて使用するため、セッションから切り離して返す
         Args:
             id: ユーザID
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             User: 取得したユーザ情報
     """
@@ -24,35 +29,37 @@ def get_user(id: int) -> User:
     if id == 0:
         return User()
     else:
-        user_repo = UserRepo()
-        return user_repo.find_by_id(id)
+        user_repo = UserRepo(session)
+        return user_repo.detach(user_repo.find_by_id(id))
 
 
-def create_user(user: User) -> User:
+def create_user(user: User, session: Optional[Session] = None) -> User:
     """
     ユーザ情報 新規登録
         Args:
             user: 登録するユーザ情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             User: 登録したユーザ情報
     """
 
-    user_repo = UserRepo()
+    user_repo = UserRepo(session)
     user_id = user_repo.create(user)
     return user_repo.find_by_id(user_id)
 
 
-def update_user(user: User) -> User:
+def update_user(user: User, session: Optional[Session] = None) -> User:
     """
     ユーザ情報 更新
         Args:
             user: 更新するユーザ情報
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
         Returns:
             user: 更新したユーザ情報
 
     """
 
-    user_repo = UserRepo()
+    user_repo = UserRepo(session)
     user_repo.update(user)
     assert user.id is not None
     return user_repo.find_by_id(user.id)
@@ -63,6 +70,8 @@ def find_users(
     user_name: Optional[str] = None,
     offset: int = 0,
     limit: int = 10,
+    session: Optional[Session] = None,
+    cursor: Optional[str] = None,
 ) -> Tuple[Sequence[User], int]:
     """
     ユーザ情報一覧取得処理
@@ -71,12 +80,25 @@ def find_users(
         user_name: 名前（部分一致）
         offset: 何件目から取得するか指定（全件表示する場合は-1を指定）
         limit: 何件取得するか指定
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
+        cursor: 前後のページのカーソル（指定時は offset を使用しない）
     Returns:
         list: 検索結果のリスト
         int: レコード件数
     """
-    user_repo = UserRepo()
-    return user_repo.find(mail_address, user_name, offset, limit)
+    user_repo = UserRepo(session)
+    return user_repo.find(mail_address, user_name, offset, limit, cursor)
+
+
+def get_list_cursors(user_list: Sequence[User]) -> Dict[str, str]:
+    """
+    一覧の前後のページを取得するカーソル
+        Args:
+            user_list: 表示中のページのユーザ情報のリスト
+        Returns:
+            dict: 前ページ（prev）・次ページ（next）のカーソル
+    """
+    return page_cursors(user_list, LIST_KEYS)
 
 
 def create_download_file(user_list: Sequence[User]) -> io.BytesIO:
@@ -152,12 +174,15 @@ def set_search_decode(user_name: str) -> str:
     return unquote(user_name)
 
 
-def check_user(user: User, mode: str) -> Tuple[bool, str]:
+def check_user(
+    user: User, mode: str, session: Optional[Session] = None
+) -> Tuple[bool, str]:
     """
     ユーザ情報更新時の入力チェック
     Args:
         user: 処理対象のユーザ情報
         mode: new or update
+        session: リクエスト単位のセッション（未指定時は処理ごとに作成）
     Returns:
         Tuple1: 完了判定（True：正常 False：エラー）
         Tuple2: エラーメッセージ
@@ -165,25 +190,30 @@ def check_user(user: User, mode: str) -> Tuple[bool, str]:
 
     # 新規処理の場合、メールアドレスの存在チェック
     if mode == "new":
-        user_repo = UserRepo()
-        dmy_user, count = user_repo.find(user.mail_address)
+        user_repo = UserRepo(session)
+        # 登録直後のユーザも重複とみなすため、レプリカではなくプライマリを参照
+        with use_primary():
+            dmy_user, count = user_repo.find(user.mail_address)
         if count > 0:
             return False, "入力したメールアドレスは既に存在します"
 
     return True, ""
 
 
-def get_selected_lists() -> Dict[str, Sequence[General]]:
+def get_selected_lists(
+    session: Optional[Session] = None,
+) -> Dict[str, Sequence[General]]:
     """
     画面の選択項目のリスト取得
         Args:
+            session: リクエスト単位のセッション（未指定時は処理ごとに作成）
 
         Returns:
             以下のリストを返す辞書
                 authority: 権限リスト
     """
 
-    general_repo = GeneralRepo()
+    general_repo = GeneralRepo(session)
 
     authority_list = general_repo.find("authority_code")
 
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api.std.env import env_float, env_int
+
+"""
+    auth_cache.py
+    認証済みユーザのキャッシュ
+    同じ認証情報での2回目以降のリクエストは、DBを参照せずにユーザ情報を返す
+        ・キーはメールアドレスと認証情報のダイジェスト（パスワードそのものは保持しない）
+        ・ユーザの更新・削除時はコミット後に破棄（他のプロセスには ttl 秒後に反映）
+        ・破棄した時刻を保持し、それより前に確認したセッションのログイン情報を再確認させる
+"""
+
+# コミット後に破棄するユーザIDを保持するセッションの info のキー
+INVALIDATE_KEY = "auth_cache_invalidate"
+
+
+class AuthCache:
+    """
+    AuthCache
+    認証済みユーザを有効期限付きで保持するLRUキャッシュ
+        ・保持件数が max_entries を超えたら、最も長く使われていないものから破棄
+        ・ttl が0以下の場合はキャッシュしない
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # ダイジェストの鍵（プロセスごとに生成し、キャッシュの中身から推測できないようにする）
+        self._key = os.urandom(32)
+        # {(メールアドレス, ダイジェスト): (ユーザ, 有効期限)}
+        self._entries: "OrderedDict[Tuple[str, bytes], Tuple[Any, float]]" = (
+            OrderedDict()
+        )
+        # {ユーザID: 最後に破棄した時刻（UNIX時刻）}
+        self._revoked: "OrderedDict[int, float]" = OrderedDict()
+        self._revoked_all = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, mail_address: str, password: str) -> Optional[Any]:
+        """
+        認証済みユーザを取得
+            Args:
+                mail_address: メールアドレス
+                password: 入力されたパスワード
+            Returns:
+                User: 認証済みのユーザ（未登録・期限切れの場合はNone）
+        """
+        if self.ttl <= 0:
+            return None
+
+        key = self._make_key(mail_address, password)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, mail_address: str, password: str, user: Any):
+        """
+        認証済みユーザを登録
+            Args:
+                mail_address: メールアドレス
+                password: 入力されたパスワード
+                user: 認証したユーザ（セッションから切り離したもの、参照のみで使用すること）
+        """
+        if self.ttl <= 0:
+            return
+
+        key = self._make_key(mail_address, password)
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """
+        ユーザのキャッシュを破棄
+            Args:
+                user_id: 破棄するユーザのID（未指定時は全件破棄）
+        """
+        now = time.time()
+        with self._lock:
+            if user_id is None:
+                removed = list(self._entries)
+                self._revoked_all = now
+            else:
+                self._revoked[user_id] = now
+                self._revoked.move_to_end(user_id)
+                if len(self._revoked) > self.max_entries:
+                    self._revoked.popitem(last=False)
+                removed = [
+                    key
+                    for key, (user, _) in self._entries.items()
+                    if user.id == user_id
+                ]
+            for key in removed:
+                del self._entries[key]
+            self.stats["invalidations"] += len(removed)
+
+    def revoked_at(self, user_id: int) -> float:
+        """
+        ユーザのキャッシュを最後に破棄した時刻を取得
+            Args:
+                user_id: ユーザID
+            Returns:
+                float: 破棄した時刻（UNIX時刻、未破棄の場合は0）
+        """
+        with self._lock:
+            return max(self._revoked.get(user_id, 0.0), self._revoked_all)
+
+    def invalidate_on_commit(self, session: Session, user_id: int):
+        """
+        ユーザのキャッシュを破棄し、セッションのコミット後にも再度破棄する
+        （コミット前に他のリクエストが更新前の値をキャッシュした場合に備える）
+            Args:
+                session: 更新を行うセッション
+                user_id: 更新・削除したユーザのID
+        """
+        self.invalidate(user_id)
+        session.info.setdefault(INVALIDATE_KEY, set()).add(user_id)
+
+    def get_stats(self) -> Dict:
+        """
+        キャッシュの件数と参照結果のカウンタを取得
+        """
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "entries": len(self._entries),
+                **self.stats,
+            }
+
+    def _make_key(self, mail_address: str, password: str) -> Tuple[str, bytes]:
+        digest = hashlib.blake2b(
+            password.encode(), key=self._key, person=b"auth_cache"
+        ).digest()
+        return mail_address, digest
+
+
+# 認証済みユーザのキャッシュ（環境変数で設定値を上書き可能）
+auth_cache = AuthCache(
+    ttl=env_float("AUTH_CACHE_TTL_SEC", 60),
+    max_entries=env_int("AUTH_CACHE_MAX_ENTRIES", 10000),
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    for user_id in session.info.pop(INVALIDATE_KEY, ()):
+        auth_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(INVALIDATE_KEY, None)
@@ -11,3 +11,13 @@ SEARCH_LIST_DISP_CNT = [10, 30, 50, 100]
 # ダウンロードファイル名
 USER_DOWNLOAD_FILE_NAME = "user_download"
 GENERAL_DOWNLOAD_FILE_NAME = "general_download"
+
+# チャット履歴の1回当たりの取得件数（既定値と上限）
+CHAT_HISTORY_PAGE_SIZE = 50
+CHAT_HISTORY_PAGE_MAX = 200
+
+# 再接続時に差分として送信するメッセージの上限（超える場合は履歴を再読込させる）
+CHAT_RESUME_MAX = 1000
+
+# クライアント側で採番するメッセージIDの最大長
+CHAT_CLIENT_MSG_ID_MAX_LEN = 64
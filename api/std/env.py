@@ -0,0 +1,36 @@
+from os import getenv
+
+"""
+    env.py
+    環境変数の設定値の読み込み
+    未設定の場合に加え、空文字・空白のみ（.env の X = "" など）の場合も既定値を使用する
+"""
+
+
+def env_str(name: str, default: str) -> str:
+    """
+    文字列の設定値を取得
+        Args:
+            name: 環境変数名
+            default: 未設定・空の場合の既定値
+        Returns:
+            str: 設定値（前後の空白は除く）
+    """
+    value = getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
+
+
+def env_int(name: str, default: int) -> int:
+    """
+    整数の設定値を取得（未設定・空の場合は既定値）
+    """
+    return int(env_str(name, str(default)))
+
+
+def env_float(name: str, default: float) -> float:
+    """
+    小数の設定値を取得（未設定・空の場合は既定値）
+    """
+    return float(env_str(name, str(default)))
@@ -0,0 +1,358 @@
+import base64
+import json
+import operator
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, and_, func, literal, or_, select
+from sqlalchemy.engine import Dialect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from api.std.env import env_int
+
+"""
+    paging.py
+    一覧画面のページ取得
+    ページ分のデータと検索結果の全件数を1回のSQL（count(*) OVER ()）で取得する
+    全件数が多い検索では、実行計画の推定行数を件数として返すこともできる（任意）
+    前後のページへの移動は、前ページの先頭・末尾の並び順の値から続きを取得する
+    keyset（シーク）方式にでき、何ページ目でも1ページ目と同じ速さで取得できる
+"""
+
+# 推定件数を使用する検索結果の行数の下限（0の場合は常に正確な件数を数える）
+#   実行計画の推定行数がこの値以上の場合、件数を数えずに推定値を返す（PostgreSQLのみ）
+APPROX_COUNT_ROWS = env_int("DB_APPROX_COUNT_ROWS", 0)
+
+# カーソルの移動方向
+CURSOR_NEXT = "next"
+CURSOR_PREV = "prev"
+
+
+class SeekKey:
+    """
+    SeekKey
+    keyset（シーク）方式のページングに使用する並び順の1項目
+    並び順の最後には一意になる項目（主キー）を含め、NULLを許容しない列を指定する
+    """
+
+    __slots__ = ("column", "descending", "getter")
+
+    def __init__(
+        self,
+        column: Any,
+        descending: bool = False,
+        getter: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.column = column
+        self.descending = descending
+        # 取得したデータから値を取り出す関数（未指定時は列と同名の属性）
+        self.getter = getter or operator.attrgetter(column.key)
+
+    def order_by(self, reverse: bool = False):
+        """
+        並び順の指定（reverse=True の場合は逆順）
+        """
+        return self.column.desc() if self.descending != reverse else self.column.asc()
+
+
+def order_by(keys: Sequence[SeekKey]) -> List:
+    """
+    並び順の項目から ORDER BY の指定を作成（検索クエリの並び順とカーソルを一致させる）
+    """
+    return [key.order_by() for key in keys]
+
+
+def page_cursors(items: Sequence[Any], keys: Sequence[SeekKey]) -> Dict[str, str]:
+    """
+    取得したページの前後のページを取得するカーソルを作成
+        Args:
+            items: 取得したページのデータ
+            keys: 検索クエリの並び順の項目
+        Returns:
+            dict: 前ページ（prev）・次ページ（next）のカーソル（データが無い場合は空文字）
+    """
+    if not items:
+        return {CURSOR_PREV: "", CURSOR_NEXT: ""}
+    return {
+        CURSOR_PREV: encode_cursor(CURSOR_PREV, [key.getter(items[0]) for key in keys]),
+        CURSOR_NEXT: encode_cursor(
+            CURSOR_NEXT, [key.getter(items[-1]) for key in keys]
+        ),
+    }
+
+
+def encode_cursor(direction: str, values: Sequence[Any]) -> str:
+    """
+    カーソル（移動方向と基準となる並び順の値）を画面へ渡す文字列に変換
+    """
+    data = json.dumps(
+        {"d": direction, "v": [_to_json(value) for value in values]},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str, keys: Sequence[SeekKey]
+) -> Optional[Tuple[str, List[Any]]]:
+    """
+    画面から受け取ったカーソルを移動方向と並び順の値に戻す
+        Returns:
+            tuple: 移動方向と並び順の値（不正なカーソルの場合はNone）
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        direction = data["d"]
+        values = [_from_json(value) for value in data["v"]]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREV) or len(values) != len(keys):
+        return None
+    return direction, values
+
+
+def fetch_page(
+    session: Session,
+    query: Select,
+    offset: int = 0,
+    limit: int = 10,
+    keys: Sequence[SeekKey] = (),
+    cursor: Optional[str] = None,
+) -> Tuple[Sequence[Any], int]:
+    """
+    ページ分のデータと検索結果の全件数を取得
+        Args:
+            session: 実行するセッション
+            query: 検索クエリ（並び順まで指定したもの）
+            offset: 何件目から取得するか指定（全件取得する場合は-1を指定）
+            limit: 何件取得するか指定
+            keys: 検索クエリの並び順の項目（カーソルを使用する場合に指定）
+            cursor: page_cursors で作成したカーソル（指定時は offset を使用しない）
+        Returns:
+            Sequence: ページ分のデータ
+            int: 検索結果の全件数（推定値の場合あり）
+    """
+    if offset < 0:
+        items = session.scalars(query).unique().all()
+        return items, len(items)
+
+    seek = decode_cursor(cursor, keys) if cursor and keys else None
+    if seek is not None:
+        return _fetch_seek_page(session, query, keys, *seek, limit)
+
+    dialect = session.get_bind().dialect
+    if _use_estimate(dialect):
+        result = session.connection().exec_driver_sql(*_explain(query, dialect))
+        estimate = _plan_rows(result.scalar())
+        if estimate >= APPROX_COUNT_ROWS:
+            items = session.scalars(query.offset(offset).limit(limit)).unique().all()
+            return items, _estimated_total(estimate, items, offset, limit)
+
+    rows = session.execute(_with_total(query, offset, limit)).unique().all()
+    if rows or offset == 0:
+        return _split_rows(rows)
+
+    # 範囲外のページの場合は件数のみ取得
+    return [], session.execute(_count_query(query)).scalar() or 0
+
+
+async def fetch_page_async(
+    session: AsyncSession,
+    query: Select,
+    offset: int = 0,
+    limit: int = 10,
+    keys: Sequence[SeekKey] = (),
+    cursor: Optional[str] = None,
+) -> Tuple[Sequence[Any], int]:
+    """
+    ページ分のデータと検索結果の全件数を取得（fetch_page の非同期版）
+    """
+    if offset < 0:
+        items = (await session.scalars(query)).unique().all()
+        return items, len(items)
+
+    seek = decode_cursor(cursor, keys) if cursor and keys else None
+    if seek is not None:
+        return await _fetch_seek_page_async(session, query, keys, *seek, limit)
+
+    dialect = session.sync_session.get_bind().dialect
+    if _use_estimate(dialect):
+        connection = await session.connection()
+        result = await connection.exec_driver_sql(*_explain(query, dialect))
+        estimate = _plan_rows(result.scalar())
+        if estimate >= APPROX_COUNT_ROWS:
+            result = await session.scalars(query.offset(offset).limit(limit))
+            items = result.unique().all()
+            return items, _estimated_total(estimate, items, offset, limit)
+
+    rows = (await session.execute(_with_total(query, offset, limit))).unique().all()
+    if rows or offset == 0:
+        return _split_rows(rows)
+
+    return [], (await session.execute(_count_query(query))).scalar() or 0
+
+
+def _fetch_seek_page(
+    session: Session,
+    query: Select,
+    keys: Sequence[SeekKey],
+    direction: str,
+    values: List[Any],
+    limit: int,
+) -> Tuple[Sequence[Any], int]:
+    """
+    カーソルの続きのページと検索結果の全件数を取得
+    """
+    seek_query = _seek_query(query, keys, direction, values, limit)
+
+    dialect = session.get_bind().dialect
+    if _use_estimate(dialect):
+        result = session.connection().exec_driver_sql(*_explain(query, dialect))
+        estimate = _plan_rows(result.scalar())
+        if estimate >= APPROX_COUNT_ROWS:
+            items = session.scalars(seek_query).unique().all()
+            return _seek_items(items, direction), estimate
+
+    rows = session.execute(_with_count(seek_query, query)).unique().all()
+    if rows:
+        items, total = _split_rows(rows)
+        return _seek_items(items, direction), total
+    return [], session.execute(_count_query(query)).scalar() or 0
+
+
+async def _fetch_seek_page_async(
+    session: AsyncSession,
+    query: Select,
+    keys: Sequence[SeekKey],
+    direction: str,
+    values: List[Any],
+    limit: int,
+) -> Tuple[Sequence[Any], int]:
+    """
+    カーソルの続きのページと検索結果の全件数を取得（_fetch_seek_page の非同期版）
+    """
+    seek_query = _seek_query(query, keys, direction, values, limit)
+
+    dialect = session.sync_session.get_bind().dialect
+    if _use_estimate(dialect):
+        connection = await session.connection()
+        result = await connection.exec_driver_sql(*_explain(query, dialect))
+        estimate = _plan_rows(result.scalar())
+        if estimate >= APPROX_COUNT_ROWS:
+            items = (await session.scalars(seek_query)).unique().all()
+            return _seek_items(items, direction), estimate
+
+    rows = (await session.execute(_with_count(seek_query, query))).unique().all()
+    if rows:
+        items, total = _split_rows(rows)
+        return _seek_items(items, direction), total
+    return [], (await session.execute(_count_query(query))).scalar() or 0
+
+
+def _use_estimate(dialect: Dialect) -> bool:
+    return APPROX_COUNT_ROWS > 0 and dialect.name == "postgresql"
+
+
+def _with_total(query: Select, offset: int, limit: int) -> Select:
+    """
+    全件数の列（ページ指定の前に数えた件数）を追加したクエリ
+    """
+    return query.add_columns(func.count().over()).offset(offset).limit(limit)
+
+
+def _seek_query(
+    query: Select,
+    keys: Sequence[SeekKey],
+    direction: str,
+    values: List[Any],
+    limit: int,
+) -> Select:
+    """
+    カーソルの値より後（前ページの場合は前）のデータを取得するクエリ
+    """
+    # 前ページは並び順を逆にして取得し、取得後に並べ直す
+    reverse = direction == CURSOR_PREV
+    # 真偽値も大小比較できるよう、列の型のバインドパラメータにする
+    params = [literal(value, key.column.type) for key, value in zip(keys, values)]
+    conditions = []
+    for i, key in enumerate(keys):
+        if key.descending != reverse:
+            after = key.column < params[i]
+        else:
+            after = key.column > params[i]
+        same = [k.column == param for k, param in zip(keys[:i], params[:i])]
+        conditions.append(and_(*same, after))
+
+    return (
+        query.where(or_(*conditions))
+        .order_by(None)
+        .order_by(*[key.order_by(reverse) for key in keys])
+        .limit(limit)
+    )
+
+
+def _seek_items(items: Sequence[Any], direction: str) -> List[Any]:
+    return list(reversed(items)) if direction == CURSOR_PREV else list(items)
+
+
+def _with_count(seek_query: Select, query: Select) -> Select:
+    """
+    検索結果の全件数の列（カーソルの条件を含まない件数）を追加したクエリ
+    """
+    return seek_query.add_columns(_count_query(query).scalar_subquery())
+
+
+def _split_rows(rows: Sequence) -> Tuple[List[Any], int]:
+    """
+    _with_total, _with_count の結果をデータと全件数に分ける
+    """
+    return [row[0] for row in rows], rows[0][-1] if rows else 0
+
+
+def _count_query(query: Select) -> Select:
+    return select(func.count()).select_from(query.order_by(None).subquery())
+
+
+def _explain(query: Select, dialect: Dialect) -> Tuple[str, Any]:
+    """
+    実行計画（JSON形式）を取得するSQLとパラメータ
+    """
+    compiled = query.compile(dialect=dialect)
+    params: Any = compiled.params
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup or [])
+    return "EXPLAIN (FORMAT JSON) " + compiled.string, params
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    return value
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["t"])
+    return value
+
+
+def _plan_rows(plan: Any) -> int:
+    """
+    実行計画から推定行数を取り出す
+    """
+    # ドライバによってはJSONが文字列のまま返される
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root: Optional[Dict] = plan[0]["Plan"] if plan else None
+    return int(root["Plan Rows"]) if root else 0
+
+
+def _estimated_total(estimate: int, items: Sequence, offset: int, limit: int) -> int:
+    """
+    推定件数を、取得結果から確定できる範囲で補正
+    """
+    # ページの途中で終わった場合は、それが最終ページのため件数が確定する
+    if len(items) < limit and (items or offset == 0):
+        return offset + len(items)
+    return max(estimate, offset + len(items))
@@ -0,0 +1,152 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection, QueuePool
+
+"""
+    pool_stats.py
+    DB接続プールの利用状況の収集
+    プールのイベントと接続取得の待ち時間から、プールサイズを決めるための統計を取る
+"""
+
+# 接続取得の待ち時間ヒストグラムの区切り（ミリ秒、これを超えたものは最後の区分）
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolStats:
+    """
+    PoolStats
+    1つのエンジンの接続プールの利用状況を集計するクラス
+        ・接続の作成・貸出・返却・無効化の件数（プールのイベントから集計）
+        ・接続取得の待ち時間（MonitoredQueuePool から通知）
+    """
+
+    def __init__(self):
+        self.engine: Optional[Engine] = None
+        # 接続の貸出・返却はスレッドプールの各スレッドから呼ばれるためロックする
+        self._lock = threading.Lock()
+        self.counts = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "soft_invalidations": 0,
+            "timeouts": 0,
+        }
+        self._wait_histogram: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def attach(self, engine: Engine):
+        """
+        エンジンの接続プールのイベントを購読
+            Args:
+                engine: 対象のエンジン（非同期エンジンの場合は sync_engine を指定）
+        """
+        self.engine = engine
+        if isinstance(engine.pool, MonitoredPoolMixin):
+            engine.pool.stats = self
+
+        event.listen(engine, "connect", lambda *args: self._count("connects"))
+        event.listen(engine, "checkout", lambda *args: self._count("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._count("checkins"))
+        event.listen(engine, "invalidate", lambda *args: self._count("invalidations"))
+        event.listen(
+            engine, "soft_invalidate", lambda *args: self._count("soft_invalidations")
+        )
+
+    def record_wait(self, elapsed: float, timed_out: bool = False):
+        """
+        接続取得の待ち時間を記録
+            Args:
+                elapsed: 待ち時間（秒）
+                timed_out: 取得がタイムアウトした場合はTrue
+        """
+        elapsed_ms = elapsed * 1000
+        index = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+
+        with self._lock:
+            self._wait_histogram[index] += 1
+            self._wait_total += elapsed_ms
+            self._wait_max = max(self._wait_max, elapsed_ms)
+            if timed_out:
+                self.counts["timeouts"] += 1
+
+    def get_stats(self) -> Dict:
+        """
+        プールの現在の状態と集計値を取得
+        """
+        stats: Dict = {}
+        if self.engine is not None:
+            pool = self.engine.pool
+            stats = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # 未使用時はマイナス（プールの空き分）になるため0で揃える
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": pool._max_overflow,
+            }
+
+        with self._lock:
+            waits = sum(self._wait_histogram)
+            labels = [f"le_{bound}ms" for bound in WAIT_BUCKETS_MS]
+            labels.append(f"gt_{WAIT_BUCKETS_MS[-1]}ms")
+            return {
+                **stats,
+                **self.counts,
+                "wait_histogram": dict(zip(labels, self._wait_histogram)),
+                "wait_avg_ms": round(self._wait_total / waits, 3) if waits else 0,
+                "wait_max_ms": round(self._wait_max, 3),
+            }
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+
+class MonitoredPoolMixin:
+    """
+    MonitoredPoolMixin
+    接続取得（プールが空の場合の待機、新規接続、pre_ping を含む）にかかった時間を
+    PoolStats へ通知する
+    """
+
+    stats: Optional[PoolStats] = None
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() でプールが作り直された場合も集計を引き継ぐ
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class MonitoredQueuePool(MonitoredPoolMixin, QueuePool):
+    """
+    待ち時間を計測する QueuePool（同期エンジン用）
+    """
+
+
+class MonitoredAsyncQueuePool(MonitoredPoolMixin, AsyncAdaptedQueuePool):
+    """
+    待ち時間を計測する AsyncAdaptedQueuePool（非同期エンジン用）
+    """
@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+"""
+    ratelimit.py
+    トークンバケット方式の流量制限
+"""
+
+
+class TokenBucket:
+    """
+    TokenBucket
+    1キー分のバケット
+    """
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    RateLimiter
+    キー（ユーザID・ルームIDなど）ごとのトークンバケット
+        ・1秒あたり rate 個のトークンを補充し、最大 burst 個まで溜められる
+        ・保持するキー数が max_keys を超えたら、最も長く使われていないキーから破棄
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        """
+        トークンを消費できるか判定（消費できる場合は消費する）
+            Args:
+                key: 制限の単位となるキー
+                cost: 消費するトークン数
+            Returns:
+                bool: 許可する場合はTrue
+        """
+        # rate が0以下の場合は制限しない
+        if self.rate <= 0:
+            return True
+
+        bucket = self._refill(key)
+        if bucket.tokens < cost:
+            return False
+        bucket.tokens -= cost
+        return True
+
+    def peek(self, key: Hashable, cost: float = 1.0) -> bool:
+        """
+        トークンを消費できるか判定（消費はしない）
+        複数のバケットを消費する場合に、全て消費できることを先に確かめるために使用する
+            Args:
+                key: 制限の単位となるキー
+                cost: 消費するトークン数
+            Returns:
+                bool: 許可できる場合はTrue
+        """
+        if self.rate <= 0:
+            return True
+        return self._refill(key).tokens >= cost
+
+    def get_stats(self) -> Dict:
+        return {"rate": self.rate, "burst": self.burst, "keys": len(self._buckets)}
+
+    def _refill(self, key: Hashable) -> TokenBucket:
+        """
+        キーのバケットを取得し、前回からの経過時間分のトークンを補充する
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(
+                self.burst, bucket.tokens + (now - bucket.updated) * self.rate
+            )
+            bucket.updated = now
+        return bucket
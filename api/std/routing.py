@@ -0,0 +1,208 @@
+import functools
+import inspect
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import Engine, Select, event
+from sqlalchemy.orm import Session
+
+"""
+    routing.py
+    参照系SQLのリードレプリカへの振り分け
+        ・read_only を付与したリポジトリのメソッド内のSELECTのみレプリカへ送る
+        ・登録・更新（flush）を行ったセッションや、直近に更新したユーザの参照はプライマリへ送る
+        ・レプリカで接続エラーが発生したら一定時間振り分け対象から外す
+"""
+
+ROUTE_REPLICA = "replica"
+ROUTE_PRIMARY = "primary"
+
+# 処理中の振り分け先（未指定時はプライマリ）
+_route: ContextVar[Optional[str]] = ContextVar("db_route", default=None)
+
+
+def read_only(func: Callable) -> Callable:
+    """
+    参照専用のリポジトリメソッドに付与するデコレータ（メソッド内のSELECTをレプリカへ送る）
+    use_primary() の範囲内で呼ばれた場合はプライマリのまま
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = _route.set(_route.get() or ROUTE_REPLICA)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _route.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _route.set(_route.get() or ROUTE_REPLICA)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _route.reset(token)
+
+    return wrapper
+
+
+@contextmanager
+def use_primary() -> Iterator[None]:
+    """
+    範囲内の参照を必ずプライマリへ送る（レプリカの遅延が許されない参照で使用）
+    """
+    token = _route.set(ROUTE_PRIMARY)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+def mark_writes(session: Session):
+    """
+    ORMを介さない更新（Core の INSERT・DELETE など）を行ったことをセッションへ記録
+    同じトランザクション内の以降の参照と、コミット後のそのユーザの参照をプライマリへ送る
+    """
+    session.info["has_writes"] = True
+
+
+class ReplicaSet:
+    """
+    ReplicaSet
+    プライマリとレプリカのエンジンを束ね、参照先のレプリカをラウンドロビンで選ぶクラス
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: List[Engine],
+        retry_interval: float = 30,
+        read_your_writes: float = 5,
+        max_writers: int = 100000,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_interval = retry_interval
+        self.read_your_writes = read_your_writes
+        self.max_writers = max_writers
+        self._counter = itertools.count()
+        # {レプリカの番号: 振り分けを再開する時刻}
+        self._down_until: Dict[int, float] = {}
+        # {ユーザID: 最後に更新をコミットした時刻}
+        self._writers: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "replica_errors": 0}
+
+        for index, replica in enumerate(replicas):
+            event.listen(replica, "handle_error", self._error_handler(index))
+
+    def choose(self, user_id: Optional[int] = None) -> Engine:
+        """
+        参照先のエンジンを選択
+            Args:
+                user_id: 参照するユーザのID（直近に更新したユーザはプライマリを参照する）
+            Returns:
+                Engine: 参照先のエンジン（使用できるレプリカが無い場合はプライマリ）
+        """
+        now = time.monotonic()
+        if user_id is not None and self._wrote_recently(user_id, now):
+            return self._primary_read()
+
+        start = next(self._counter)
+        for i in range(len(self.replicas)):
+            index = (start + i) % len(self.replicas)
+            if self._down_until.get(index, 0) <= now:
+                self.stats["replica_reads"] += 1
+                return self.replicas[index]
+        return self._primary_read()
+
+    def mark_written(self, user_id: int):
+        """
+        ユーザが更新をコミットしたことを記録（一定時間はそのユーザの参照をプライマリへ送る）
+            Args:
+                user_id: 更新したユーザのID
+        """
+        with self._lock:
+            self._writers[user_id] = time.monotonic()
+            self._writers.move_to_end(user_id)
+            if len(self._writers) > self.max_writers:
+                self._writers.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        """
+        レプリカの状態と振り分け件数を取得
+        """
+        now = time.monotonic()
+        return {
+            "replicas": len(self.replicas),
+            "down": [i for i, until in self._down_until.items() if until > now],
+            **self.stats,
+        }
+
+    def _wrote_recently(self, user_id: int, now: float) -> bool:
+        with self._lock:
+            written = self._writers.get(user_id)
+        return written is not None and now - written < self.read_your_writes
+
+    def _primary_read(self) -> Engine:
+        self.stats["primary_reads"] += 1
+        return self.primary
+
+    def _error_handler(self, index: int):
+        def handle_error(context):
+            # 接続断の場合のみ一定時間振り分け対象から外す（SQLのエラーは対象外）
+            if context.is_disconnect:
+                self.stats["replica_errors"] += 1
+                self._down_until[index] = time.monotonic() + self.retry_interval
+
+        return handle_error
+
+
+class RoutingSession(Session):
+    """
+    RoutingSession
+    SQLごとにプライマリ・レプリカを振り分けるセッション
+    振り分け先は replica_set を設定したサブクラスで指定する（未設定時は通常のセッションと同じ）
+    """
+
+    replica_set: Optional[ReplicaSet] = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica_set = self.replica_set
+        if (
+            replica_set is None
+            or not replica_set.replicas
+            or _route.get() != ROUTE_REPLICA
+            or self._flushing
+            or self.info.get("has_writes")
+            or not isinstance(clause, Select)
+        ):
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        return replica_set.choose(self.info.get("user_id"))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session: Session, flush_context):
+    # 同じトランザクション内の以降の参照は、未反映の更新が見えるプライマリへ送る
+    mark_writes(session)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session: Session):
+    replica_set = getattr(session, "replica_set", None)
+    user_id = session.info.get("user_id")
+    if session.info.pop("has_writes", False) and replica_set and user_id is not None:
+        replica_set.mark_written(user_id)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop("has_writes", None)
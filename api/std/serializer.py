@@ -0,0 +1,63 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse as _JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+    serializer.py
+    JSONのシリアライズ処理
+    orjsonがインストールされていれば使用し、無ければ標準のjsonで代替する
+"""
+
+
+def dumps(obj: Any) -> str:
+    """
+    オブジェクトをJSON文字列へ変換
+    Args:
+        obj > 変換対象
+    Returns:
+        JSON文字列
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    オブジェクトをJSON（UTF-8のバイト列）へ変換
+    Args:
+        obj > 変換対象
+    Returns:
+        JSONのバイト列
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    JSON文字列をオブジェクトへ変換
+    Args:
+        data > JSON文字列
+    Returns:
+        変換後のオブジェクト
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONResponse(_JSONResponse):
+    """
+    上記のシリアライザを使用するJSONレスポンス
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
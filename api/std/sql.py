@@ -1,20 +1,36 @@
+import io
+from decimal import Decimal
 from os import getenv
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
 
-from sqlalchemy import Connection, Engine, Row, text
+from sqlalchemy import Connection, Engine, Row, Table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.engine import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session as OrmSession
 from sqlalchemy.orm import sessionmaker
 
+from api.std.env import env_float, env_int, env_str
+from api.std.pool_stats import MonitoredAsyncQueuePool, MonitoredQueuePool, PoolStats
+from api.std.routing import ReplicaSet, RoutingSession
+from api.std.sql_monitor import sql_monitor
+
 """
     Sql
     汎用的なSQL処理を束ねたモジュール
     各repositoriesにImportすることを想定
 """
 
+# PostgreSQLの1文あたりのバインドパラメータ数の上限（65535）に余裕を持たせた値
+MAX_BIND_PARAMS = 60000
+
 
-def create_sql_engine() -> Engine:
+def create_db_url(driver: str, server: Optional[str] = None) -> str:
     """
-    SQL実行エンジンを作成 (PostgreSQL用)
+    接続URLを作成 (PostgreSQL用)
+        Args:
+            driver: 使用するドライバ（psycopg2, asyncpg）
+            server: 接続先（ホスト名:ポート、レプリカ用。未指定時は DB_SERVER, DB_PORT）
     """
 
     # 環境変数から接続情報を取得
@@ -24,18 +40,150 @@ def create_sql_engine() -> Engine:
     port = getenv("DB_PORT")
     database = getenv("DB_DATABASE")
 
-    db_url = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
+    if server:
+        host, _, server_port = server.partition(":")
+        port = server_port or port
 
+    return f"postgresql+{driver}://{user}:{password}@{host}:{port}/{database}"
+
+
+def create_pool_options() -> dict:
+    """
+    接続プールの設定を作成（環境変数で上書き可能）
+    同期・非同期のエンジンはそれぞれ別のプールを持つため、DBの最大接続数は
+    (pool_size + max_overflow) × 2 × ワーカー数 を上限として見積もる
+    """
+    return {
+        "pool_size": env_int("DB_POOL_SIZE", 10),
+        "max_overflow": env_int("DB_MAX_OVERFLOW", 30),
+        "pool_timeout": env_float("DB_POOL_TIMEOUT_SEC", 30),
+        "pool_recycle": env_int("DB_POOL_RECYCLE_SEC", -1),
+        "pool_pre_ping": env_str("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def create_sql_engine(server: Optional[str] = None) -> Engine:
+    """
+    SQL実行エンジンを作成 (PostgreSQL用)
+        Args:
+            server: 接続先（レプリカ用、未指定時はプライマリ）
+    """
     return create_engine(
-        db_url,
-        pool_size=10,
-        max_overflow=30,
-        pool_pre_ping=True,
+        create_db_url("psycopg2", server),
+        poolclass=MonitoredQueuePool,
+        **create_pool_options(),
+    )
+
+
+def create_async_sql_engine(server: Optional[str] = None) -> AsyncEngine:
+    """
+    非同期SQL実行エンジンを作成 (PostgreSQL用)
+    接続情報は同期版と同じ環境変数を使用する
+        Args:
+            server: 接続先（レプリカ用、未指定時はプライマリ）
+    """
+    return create_async_engine(
+        create_db_url("asyncpg", server),
+        poolclass=MonitoredAsyncQueuePool,
+        **create_pool_options(),
     )
 
 
 engine = create_sql_engine()
-Session = sessionmaker(bind=engine)
+async_engine = create_async_sql_engine()
+
+# リードレプリカ（DB_REPLICA_SERVERS にカンマ区切りで指定、未指定時はプライマリのみ）
+replica_servers = [
+    server.strip()
+    for server in env_str("DB_REPLICA_SERVERS", "").split(",")
+    if server.strip()
+]
+replica_engines = [create_sql_engine(server) for server in replica_servers]
+async_replica_engines = [create_async_sql_engine(server) for server in replica_servers]
+
+replica_options = {
+    "retry_interval": env_float("DB_REPLICA_RETRY_SEC", 30),
+    "read_your_writes": env_float("DB_READ_YOUR_WRITES_SEC", 5),
+}
+replicas = ReplicaSet(engine, replica_engines, **replica_options)
+async_replicas = ReplicaSet(
+    async_engine.sync_engine,
+    [replica.sync_engine for replica in async_replica_engines],
+    **replica_options,
+)
+
+
+class PrimaryReplicaSession(RoutingSession):
+    """
+    参照をレプリカへ振り分けるセッション（同期版）
+    """
+
+    replica_set = replicas
+
+
+class AsyncPrimaryReplicaSession(RoutingSession):
+    """
+    参照をレプリカへ振り分けるセッション（非同期版の内部で使用）
+    """
+
+    replica_set = async_replicas
+
+
+Session = sessionmaker(bind=engine, class_=PrimaryReplicaSession)
+
+# 非同期版（イベントループ上で実行する処理から使用する）
+#   コミット後も取得済みの値を参照できるよう expire_on_commit=False とする
+AsyncSession = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=AsyncPrimaryReplicaSession,
+    expire_on_commit=False,
+)
+
+# 接続プールの利用状況
+pool_stats = PoolStats()
+pool_stats.attach(engine)
+async_pool_stats = PoolStats()
+async_pool_stats.attach(async_engine.sync_engine)
+
+# SQL実行の計測
+sql_monitor.attach(engine)
+sql_monitor.attach(async_engine.sync_engine)
+for replica in replica_engines:
+    sql_monitor.attach(replica)
+for replica in async_replica_engines:
+    sql_monitor.attach(replica.sync_engine)
+
+
+def get_pool_stats() -> Dict:
+    """
+    接続プールの利用状況を取得
+    """
+    return {
+        "sync": pool_stats.get_stats(),
+        "async": async_pool_stats.get_stats(),
+        "replicas": {
+            "sync": replicas.get_stats(),
+            "async": async_replicas.get_stats(),
+        },
+    }
+
+
+def get_session() -> Iterator[OrmSession]:
+    """
+    リクエスト単位のセッションを取得（FastAPIの依存関係として使用）
+    1リクエストの処理を1接続・1トランザクションで行い、
+    正常終了時にコミット、例外発生時はロールバックする
+        Returns:
+            Session: リクエスト単位のセッション（各repositoriesのコンストラクタに渡す）
+    """
+    # レスポンス作成時にも取得済みの値を参照できるよう、コミット時に失効させない
+    with Session(expire_on_commit=False) as session:
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
 
 
 def execute(sql: str, connection: Connection, params: dict = {}):
@@ -94,3 +242,184 @@ def delete(sql: str, params: dict = {}, connection: Optional[Connection] = None)
     削除行数を返す
     """
     return update(sql, params, connection)
+
+
+def insert_many(
+    table: Table,
+    rows: Sequence[Dict[str, Any]],
+    returning: Optional[str] = "id",
+    chunk_size: int = 1000,
+    connection: Optional[Connection] = None,
+) -> List[Any]:
+    """
+    複数行INSERTで一括登録（chunk_size 行ごとに1文で実行）
+        Args:
+            table: 登録先のテーブル（エンティティの __table__）
+            rows: 登録する行（列名をキーにした辞書、全行で同じキーを持つこと）
+            returning: 登録した行から返す列名（None の場合は返さない）
+            chunk_size: 1文で登録する最大行数
+            connection: 使用する接続（未指定時は新規に接続してコミットする）
+        Returns:
+            list: 登録した行の returning 列の値（rows と同じ順序）
+                  returning が None の場合は空のリスト
+    """
+
+    def run(connection: Connection) -> List[Any]:
+        values = []
+        for chunk in _chunks(rows, chunk_size):
+            if returning is None:
+                connection.execute(pg_insert(table).values(chunk))
+            else:
+                # 複数行INSERTの RETURNING は順序が保証されないため、
+                # insertmanyvalues で登録し、結果を rows の順に並べ直させる
+                statement = pg_insert(table).returning(
+                    table.c[returning], sort_by_parameter_order=True
+                )
+                result = connection.execute(statement, chunk)
+                values.extend(result.scalars().all())
+        return values
+
+    return _run(run, connection)
+
+
+def upsert_many(
+    table: Table,
+    rows: Sequence[Dict[str, Any]],
+    conflict_columns: Sequence[str],
+    update_columns: Optional[Sequence[str]] = None,
+    chunk_size: int = 1000,
+    connection: Optional[Connection] = None,
+) -> int:
+    """
+    ON CONFLICT を使用した一括登録・更新（chunk_size 行ごとに1文で実行）
+        Args:
+            table: 登録先のテーブル（エンティティの __table__）
+            rows: 登録する行（列名をキーにした辞書、全行で同じキーを持つこと）
+            conflict_columns: 重複を判定する列（一意制約・主キーの列）
+            update_columns: 重複時に更新する列（未指定時は重複した行を読み飛ばす）
+            chunk_size: 1文で登録する最大行数
+            connection: 使用する接続（未指定時は新規に接続してコミットする）
+        Returns:
+            int: 登録・更新した行数
+    """
+
+    def run(connection: Connection) -> int:
+        count = 0
+        for chunk in _chunks(rows, chunk_size):
+            statement = pg_insert(table).values(chunk)
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=list(conflict_columns),
+                    set_={c: statement.excluded[c] for c in update_columns},
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(
+                    index_elements=list(conflict_columns)
+                )
+            count += connection.execute(statement).rowcount
+        return count
+
+    return _run(run, connection)
+
+
+def copy_from(
+    table_name: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    connection: Optional[Connection] = None,
+    buffer_rows: int = 10000,
+) -> int:
+    """
+    COPY FROM STDIN で一括登録（大量データの取込用）
+    行は buffer_rows 行ずつCSVへ変換して送るため、ジェネレータを渡せば全件をメモリに載せない
+        Args:
+            table_name: 登録先のテーブル名
+            columns: 登録する列名
+            rows: 登録する行（columns の順に値を並べたタプルなど）
+            connection: 使用する接続（未指定時は新規に接続してコミットする）
+            buffer_rows: 1回に変換する行数
+        Returns:
+            int: 登録した行数
+    """
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    copy_sql = f'COPY "{table_name}" ({column_list}) FROM STDIN WITH (FORMAT csv)'
+
+    def run(connection: Connection) -> int:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(copy_sql, _CsvStream(rows, buffer_rows))
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    return _run(run, connection)
+
+
+class _CsvStream(io.RawIOBase):
+    """
+    行のイテレータを少しずつCSVへ変換して読み出すストリーム（copy_from 用）
+        ・文字列は常に引用符で囲み、None は引用符無しの空欄（=NULL）として出力する
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]], buffer_rows: int):
+        self._rows = iter(rows)
+        self._buffer_rows = buffer_rows
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._pending) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._pending += chunk
+
+        if size < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _next_chunk(self) -> bytes:
+        lines = []
+        for _ in range(self._buffer_rows):
+            row = next(self._rows, None)
+            if row is None:
+                break
+            lines.append(",".join(_csv_field(value) for value in row) + "\n")
+        return "".join(lines).encode()
+
+
+def _csv_field(value: Any) -> str:
+    """
+    COPY（CSV形式）の1項目へ変換
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (bool, int, float, Decimal)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _chunks(rows: Sequence[Dict[str, Any]], chunk_size: int) -> Iterator[Sequence]:
+    """
+    1文のバインドパラメータ数が上限を超えないよう行を分割
+    """
+    if not rows:
+        return
+    chunk_size = max(1, min(chunk_size, MAX_BIND_PARAMS // max(1, len(rows[0]))))
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start : start + chunk_size]
+
+
+def _run(func: Callable[[Connection], Any], connection: Optional[Connection]) -> Any:
+    """
+    接続が指定されていればその接続で、未指定時は新規に接続してコミットまで実行
+    """
+    if connection is None:
+        with engine.begin() as connection:
+            return func(connection)
+    else:
+        return func(connection)
@@ -0,0 +1,286 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.std.env import env_float, env_int
+from api.std.logging import log
+
+"""
+    sql_monitor.py
+    SQL実行の計測
+    実行件数・実行時間をリクエスト単位で集計し、遅いSQLと同一SQLの繰り返し（N+1）を警告する
+"""
+
+# ログに出力するSQLの最大文字数
+STATEMENT_LOG_MAX_LEN = 1000
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    SQLの実行件数が上限を超えた（テストでのルートごとの件数確認用）
+    """
+
+
+class QueryStats:
+    """
+    QueryStats
+    1リクエスト（または計測範囲）分のSQL実行の集計
+    """
+
+    __slots__ = (
+        "label",
+        "count",
+        "total_time",
+        "slowest_time",
+        "slowest_statement",
+        "statements",
+    )
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = ""
+        # {SQL: 実行回数}（N+1の判定用）
+        self.statements: Dict[str, int] = {}
+
+    def add(self, statement: str, elapsed: float) -> int:
+        """
+        実行したSQLを集計
+            Args:
+                statement: 実行したSQL
+                elapsed: 実行時間（秒）
+            Returns:
+                int: 同一SQLの実行回数
+        """
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+        repeat = self.statements.get(statement, 0) + 1
+        self.statements[statement] = repeat
+        return repeat
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing ヘッダの値（ブラウザの開発者ツールで確認できる）
+        合計時間と、最も遅かったSQLの時間を返す
+        """
+        return (
+            f'db;dur={self.total_time * 1000:.1f};desc="{self.count} queries",'
+            f" db-slowest;dur={self.slowest_time * 1000:.1f}"
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_time * 1000, 3),
+            "slowest_ms": round(self.slowest_time * 1000, 3),
+            "slowest_statement": _shorten(self.slowest_statement),
+        }
+
+
+class SqlMonitor:
+    """
+    SqlMonitor
+    エンジンのSQL実行イベントを購読して、実行件数・時間を集計するクラス
+        ・track() の範囲内で実行したSQLをリクエスト単位で集計（contextvarで引き継ぐ）
+        ・slow_ms を超えたSQLは、パラメータの型とともにログへ出力
+        ・1リクエスト内で同一SQLが n_plus_one 回を超えて実行されたら警告
+    """
+
+    def __init__(self, slow_ms: float = 200, n_plus_one: int = 10):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self._current: ContextVar[Optional[QueryStats]] = ContextVar(
+            "sql_query_stats", default=None
+        )
+        # query_budget() の計測範囲（スレッド・イベントループをまたいで集計する）
+        self._budgets: List[QueryStats] = []
+        self._lock = threading.Lock()
+        self.stats = {"statements": 0, "total_ms": 0.0, "slow": 0, "n_plus_one": 0}
+
+    def attach(self, engine: Engine):
+        """
+        エンジンのSQL実行イベントを購読
+            Args:
+                engine: 対象のエンジン（非同期エンジンの場合は sync_engine を指定）
+        """
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @contextmanager
+    def track(self, label: str = "") -> Iterator[QueryStats]:
+        """
+        範囲内で実行したSQLを集計
+            Args:
+                label: ログに出力する計測範囲の名前（リクエストのパスなど）
+            Returns:
+                QueryStats: 集計結果
+        """
+        query_stats = QueryStats(label)
+        token = self._current.set(query_stats)
+        try:
+            yield query_stats
+        finally:
+            self._current.reset(token)
+
+    @contextmanager
+    def query_budget(self, max_count: int) -> Iterator[QueryStats]:
+        """
+        範囲内で実行したSQLの件数が上限を超えたら QueryBudgetExceeded を発生させる
+        テストクライアントのように別スレッドで実行されるSQLも含めて数える
+            with sql_monitor.query_budget(3):
+                client.get("/room/list")
+            Args:
+                max_count: SQLの実行件数の上限
+            Returns:
+                QueryStats: 集計結果
+        """
+        query_stats = QueryStats("query_budget")
+        with self._lock:
+            self._budgets.append(query_stats)
+        try:
+            yield query_stats
+        finally:
+            with self._lock:
+                self._budgets.remove(query_stats)
+
+        if query_stats.count > max_count:
+            raise QueryBudgetExceeded(
+                f"SQLの実行件数が上限を超えました: {query_stats.count} > {max_count}\n"
+                + "\n".join(
+                    f"{count}回: {_shorten(statement)}"
+                    for statement, count in query_stats.statements.items()
+                )
+            )
+
+    def get_stats(self) -> Dict:
+        """
+        起動からの累計を取得
+        """
+        with self._lock:
+            return {
+                **self.stats,
+                "total_ms": round(self.stats["total_ms"], 3),
+                "slow_ms": self.slow_ms,
+                "n_plus_one_threshold": self.n_plus_one,
+            }
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        elapsed_ms = elapsed * 1000
+        slow = elapsed_ms > self.slow_ms
+
+        with self._lock:
+            self.stats["statements"] += 1
+            self.stats["total_ms"] += elapsed_ms
+            if slow:
+                self.stats["slow"] += 1
+            for budget in self._budgets:
+                budget.add(statement, elapsed)
+
+        query_stats = self._current.get()
+        label = query_stats.label if query_stats is not None else "-"
+
+        if slow:
+            log.warning(
+                f"SQL遅延 {elapsed_ms:.1f}ms ({label}): {_shorten(statement)}"
+                f" params={_param_shape(parameters, executemany)}"
+            )
+
+        if query_stats is None:
+            return
+        repeat = query_stats.add(statement, elapsed)
+        # しきい値を超えた時点で1回だけ警告する
+        if self.n_plus_one > 0 and repeat == self.n_plus_one + 1:
+            with self._lock:
+                self.stats["n_plus_one"] += 1
+            log.warning(
+                f"N+1の可能性 ({label}): 同一SQLが{self.n_plus_one}回を超えて実行されました:"
+                f" {_shorten(statement)}"
+            )
+
+
+class SqlMonitorMiddleware:
+    """
+    SqlMonitorMiddleware
+    HTTPリクエストごとにSQLの実行件数・時間を集計し、Server-Timing ヘッダで返す
+    SQLの合計時間が slow_ms を超えたリクエストは、最も遅かったSQLとともにログへ出力
+    """
+
+    def __init__(self, app: ASGIApp, monitor: "SqlMonitor"):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with self.monitor.track(f"{scope['method']} {scope['path']}") as query_stats:
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", query_stats.server_timing())
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if query_stats.total_time * 1000 > self.monitor.slow_ms:
+                    log.warning(
+                        f"SQL遅延リクエスト ({query_stats.label}):"
+                        f" {query_stats.to_dict()}"
+                    )
+
+
+def _shorten(statement: str) -> str:
+    """
+    ログ出力用にSQLの空白・改行を詰めて切り詰める
+    """
+    statement = " ".join(statement.split())
+    if len(statement) > STATEMENT_LOG_MAX_LEN:
+        return statement[:STATEMENT_LOG_MAX_LEN] + "..."
+    return statement
+
+
+def _param_shape(parameters: Any, executemany: bool) -> str:
+    """
+    パラメータの値を出さずに、形（キーと型）だけを文字列化
+    """
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = _param_shape(parameters[0], False) if parameters else "-"
+        return f"{len(parameters)}行 x {first}"
+    if isinstance(parameters, dict):
+        return (
+            "{"
+            + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items())
+            + "}"
+        )
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+# SQL実行の計測（環境変数で設定値を上書き可能）
+sql_monitor = SqlMonitor(
+    slow_ms=env_float("SQL_SLOW_QUERY_MS", 200),
+    n_plus_one=env_int("SQL_N_PLUS_ONE_THRESHOLD", 10),
+)
@@ -9,8 +9,8 @@ VALUES
 INSERT INTO "public"."m_general"
 (category, code, code_value, code_reserve01_text, code_reserve02_text, code_reserve01_flag, code_reserve02_flag, code_reserve01_code, code_reserve02_code, sort_key, remarks, create_user, create_date, update_user, update_date, del_flag)
 VALUES 
-('authority_code', 0, '一般利用者権限', NULL, NULL, FALSE, FALSE, NULL, NULL, 1000, '権限コード', 'SYSTEM', NOW(), 'SYSTEM', NOW(), FALSE),
-('authority_code', 99, '管理者権限', NULL, NULL, FALSE, FALSE, NULL, NULL, 1030, '権限コード', 'SYSTEM', NOW(), 'SYSTEM', NOW(), FALSE);
+('authority_code', 0, '一般利用者権限', '^/$ ^/room/list$ ^/room/\d{1,10}/form$ ^/room/\d{1,10}/api$ ^/room_entry$ ^/chat/\d{1,10}/form$ ^/chat/\d{1,10}/api$ ^/user/\d{1,10}/disp$ ^/user/\d{1,10}/edit$ ^/user_entry$', NULL, FALSE, FALSE, NULL, NULL, 1000, '権限コード', 'SYSTEM', NOW(), 'SYSTEM', NOW(), FALSE),
+('authority_code', 99, '管理者権限', '.{1,255}', NULL, FALSE, FALSE, NULL, NULL, 1030, '権限コード', 'SYSTEM', NOW(), 'SYSTEM', NOW(), FALSE);
 
 
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
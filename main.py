@@ -1,22 +1,30 @@
 import importlib
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Awaitable, Callable
+from typing import List, Tuple
 
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from api.entities.base import Base
 from api.entities.user import User
 from api.services import auth
+from api.services.connection import manager
+from api.services.message_buffer import history_buffer
+from api.services.message_guard import guard
+from api.services.message_writer import writer
+from api.services.permission import permission_matcher
 from api.std import func, sql
+from api.std.auth_cache import auth_cache
 from api.std.logging import log
+from api.std.sql_monitor import SqlMonitorMiddleware, sql_monitor
 from exceptions import (
     AuthenticationException,
     AuthorizationException,
@@ -27,8 +35,25 @@ from exceptions import (
 load_dotenv(override=True)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    起動・終了処理
+    """
+    # チャットメッセージの一括登録タスク、ワーカー間配信を開始
+    await writer.start()
+    await manager.start()
+    yield
+    # 未登録のメッセージを全て登録してから終了
+    await manager.stop()
+    await writer.stop()
+    await sql.async_engine.dispose()
+    for replica in sql.async_replica_engines:
+        await replica.dispose()
+
+
 # 初期設定
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 base_dir = Path(__file__).resolve().parent
 app.mount("/static", StaticFiles(directory=base_dir / "ui/static"), name="static")
 templates = Jinja2Templates(directory=base_dir / "ui/templates")
@@ -46,69 +71,100 @@ for filepath in router_directory.glob("*.py"):
 
 
 # セキュリティ強化のためのミドルウェア
-class SecurityHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
-    ) -> Response:
+#   ASGIのメッセージを直接加工する（レスポンスの本文はバッファせずにそのまま流す）
+#   WebSocket・lifespan はそのまま通す
+class SecurityHeaderMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # レスポンスに付与するヘッダは起動時に1回だけ作成
+        self.raw_headers = create_security_headers()
+        # 付与する値で置き換えるヘッダ（Set-Cookie は追加）
+        self.replace_keys = {k for k, _ in self.raw_headers if k != b"set-cookie"}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope, receive)
 
         try:
-
             # アクセスログ記録
             log.info(
                 f"{await auth.get_user_info(request)} - {request.method} {request.url}"
             )
-
-            # クロスサイトリクエストフォージェリ（CSRF）攻撃に対する対策
-            #   リクエストのクッキーから"strict"という名前のクッキーを取得し、その値をrequest.state.strictに保存。
-            request.state.strict = request.cookies.get("strict", None)
-            #   POSTおよびDELETEメソッドでかつstrictクッキーが存在しない場合は例外発生
-            if (
-                request.method == "POST" or request.method == "DELETE"
-            ) and not request.state.strict:
-                raise NotPermittedException()
-
-            # エンドポイント呼び出し
-            response = await call_next(request)
-
-            # Cookieを設定
-            #   SameSite属性: samesite="strict"を設定することで、クッキーが同一サイトからのリクエストに対してのみ送信されるようにする。
-            #                これにより、クロスサイトリクエストフォージェリ（CSRF）攻撃を防ぐ。
-            #   HttpOnly属性: httponly=Trueを設定することで、クッキーがJavaScriptからアクセスできないようにする。
-            #                これにより、クッキーのセキュリティが向上する。
-            #   Secure属性:   secure=Trueを設定することで、クッキーがHTTPS接続でのみ送信されるようにする。
-            #                これにより、クッキーの盗聴を防ぐ。
-            response.set_cookie(
-                "strict",
-                "strict",
-                (24 * 60 * 60),
-                path="/",
-                samesite="strict",
-                httponly=True,
-                secure=True,
-            )
-
-            # CSPヘッダをレスポンスに追加する
-            response.headers["Content-Security-Policy"] = (
-                "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline'; script-src-attr 'self' 'unsafe-inline'"
-            )
-
-            # frame のソースを同一サイト内に限定する
-            response.headers["X-Frame-Options"] = "SAMEORIGIN"
-
-            return response
-
         except HTTPException as h_exc:
             # 401が発生したら認証ダイアログを表示
             if h_exc.status_code == 401:
-                return Response(
+                response = Response(
                     content=h_exc.detail,
                     status_code=h_exc.status_code,
                     headers={"WWW-Authenticate": "Basic"},
                 )
+                await response(scope, receive, send)
+                return
             else:
                 log.error(f"HTTPException: {h_exc.detail}")
                 raise
 
+        # クロスサイトリクエストフォージェリ（CSRF）攻撃に対する対策
+        #   リクエストのクッキーから"strict"という名前のクッキーを取得し、その値をrequest.state.strictに保存。
+        request.state.strict = request.cookies.get("strict", None)
+        #   POSTおよびDELETEメソッドでかつstrictクッキーが存在しない場合は例外発生
+        if (
+            request.method == "POST" or request.method == "DELETE"
+        ) and not request.state.strict:
+            raise NotPermittedException()
+
+        async def send_wrapper(message: Message):
+            # レスポンスヘッダの送信時にセキュリティ関連のヘッダを付与
+            if message["type"] == "http.response.start":
+                headers = [
+                    (k, v)
+                    for k, v in message.get("headers", [])
+                    if k.lower() not in self.replace_keys
+                ]
+                message["headers"] = headers + self.raw_headers
+            await send(message)
+
+        # エンドポイント呼び出し
+        await self.app(scope, receive, send_wrapper)
+
+
+def create_security_headers() -> List[Tuple[bytes, bytes]]:
+    """
+    レスポンスに付与するセキュリティ関連のヘッダを作成
+    """
+    response = Response()
+
+    # Cookieを設定
+    #   SameSite属性: samesite="strict"を設定することで、クッキーが同一サイトからのリクエストに対してのみ送信されるようにする。
+    #                これにより、クロスサイトリクエストフォージェリ（CSRF）攻撃を防ぐ。
+    #   HttpOnly属性: httponly=Trueを設定することで、クッキーがJavaScriptからアクセスできないようにする。
+    #                これにより、クッキーのセキュリティが向上する。
+    #   Secure属性:   secure=Trueを設定することで、クッキーがHTTPS接続でのみ送信されるようにする。
+    #                これにより、クッキーの盗聴を防ぐ。
+    response.set_cookie(
+        "strict",
+        "strict",
+        (24 * 60 * 60),
+        path="/",
+        samesite="strict",
+        httponly=True,
+        secure=True,
+    )
+
+    # CSPヘッダをレスポンスに追加する
+    response.headers["Content-Security-Policy"] = (
+        "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline'; script-src-attr 'self' 'unsafe-inline'"
+    )
+
+    # frame のソースを同一サイト内に限定する
+    response.headers["X-Frame-Options"] = "SAMEORIGIN"
+
+    # 本文の無いレスポンスで付与された Content-Length は除く
+    return [(k, v) for k, v in response.raw_headers if k != b"content-length"]
+
 
 # SecurityHeaderMiddleware を追加
 app.add_middleware(SecurityHeaderMiddleware)
@@ -122,6 +178,10 @@ app.add_middleware(
 )
 
 
+# SqlMonitorMiddleware を追加（認証処理のSQLも含めて集計するため最も外側に置く）
+app.add_middleware(SqlMonitorMiddleware, monitor=sql_monitor)
+
+
 @app.get("/")
 async def root(request: Request, login_user: User = Depends(auth.check_auth)):
     """
@@ -155,6 +215,23 @@ def healthcheck():
     return {"message": "healthcheck"}
 
 
+@app.get("/stats")
+def stats(login_user: User = Depends(auth.check_auth)):
+    """
+    稼働状況の統計情報（管理者向け）
+    """
+    return {
+        "chat": manager.get_stats(),
+        "message_writer": writer.get_stats(),
+        "message_guard": guard.get_stats(),
+        "history_buffer": history_buffer.get_stats(),
+        "db_pool": sql.get_pool_stats(),
+        "sql": sql_monitor.get_stats(),
+        "auth_cache": auth_cache.get_stats(),
+        "permission": permission_matcher.get_stats(),
+    }
+
+
 def drop_all_fk():
     """
     全ての外部制約をDROPする（PostgreSQL版）
@@ -206,10 +283,15 @@ def set_data_init():
     # セミコロンで分割
     statements = sql_text.split(";")
 
-    for statement in statements:
-        sql_query = statement.strip()
-        if sql_query and not sql_query.startswith("--"):  # コメント行は除外
-            sql.update(sql_query)
+    # 1接続・1トランザクションでまとめて実行
+    with sql.engine.begin() as connection:
+        for statement in statements:
+            sql_query = statement.strip()
+            if sql_query and not sql_query.startswith("--"):  # コメント行は除外
+                sql.update(sql_query, connection=connection)
+
+    # 初期設定した権限コードを次回の判定時に読み込む
+    permission_matcher.mark_stale()
 
 
 @app.post("/init/run")
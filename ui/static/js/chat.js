@@ -5,9 +5,25 @@ const room_id = document.getElementById("hdn_room_id").value;
 const user_id = document.getElementById("hdn_user_id").value;
 const user_name = document.getElementById("hdn_user_name").value;
 
-    const ws = new WebSocket(
-    `ws://${location.host}/ws/${encodeURIComponent(room_id)}/${encodeURIComponent(user_id)}/${encodeURIComponent(user_name)}`
-);
+const wsUrl = `ws://${location.host}/ws/${encodeURIComponent(room_id)}/${encodeURIComponent(user_id)}/${encodeURIComponent(user_name)}`;
+let ws = null;
+
+// 受信済みの最後のメッセージID（再接続時に差分を受け取る起点）
+let lastMessageId = null;
+// 表示済みメッセージのクライアントメッセージID（再送・差分送信による重複表示の防止）
+const seenClientIds = new Set();
+// 送信済みで登録を確認できていないメッセージ（再接続時に再送する）
+const outbox = new Map();
+// 送信が拒否された場合のメッセージ
+const sendErrorMessages = {
+    too_long: "メッセージが長すぎます。",
+    empty: "メッセージを入力してください。",
+    user_rate_limited: "送信間隔が短すぎます。しばらく待ってから送信してください。",
+    room_rate_limited: "ルームが混み合っています。しばらく待ってから送信してください。",
+    not_persisted: "メッセージを保存できませんでした。もう一度送信してください。",
+};
+// 再接続までの待ち時間（ミリ秒、失敗するたびに延ばす）
+let reconnectDelay = 1000;
 
 const chatForm = document.getElementById("chatForm");
 const chatInput = document.getElementById("chatInput");
@@ -18,7 +34,12 @@ let isComposing = false;
 chatInput.addEventListener("compositionstart", () => isComposing = true);
 chatInput.addEventListener("compositionend", () => isComposing = false);
 
-function addMessage(text, sender) {
+// 表示中の最も古いメッセージID（過去の履歴を読み込む際の起点）と続きの有無
+let oldestMessageId = null;
+let hasMoreHistory = false;
+let isLoadingHistory = false;
+
+function createMessage(text, sender) {
     const wrapper = document.createElement("div");
     wrapper.classList.add("message-wrapper");
 
@@ -37,15 +58,36 @@ function addMessage(text, sender) {
 
     wrapper.appendChild(senderEl);
     wrapper.appendChild(msgEl);
-    chatMessages.appendChild(wrapper);
+    return wrapper;
+}
+
+function addMessage(text, sender) {
+    chatMessages.appendChild(createMessage(text, sender));
     chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
+// クライアントメッセージIDを採番
+function newClientMsgId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// メッセージを送信（接続中でなければ再接続時に送信）
+function sendMessage(clientMsgId, text) {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ client_msg_id: clientMsgId, message: text }));
+    }
+}
+
 chatForm.addEventListener("submit", (e) => {
     e.preventDefault();
     const text = chatInput.value.trim();
     if (text) {
-        ws.send(text);
+        const clientMsgId = newClientMsgId();
+        outbox.set(clientMsgId, text);
+        sendMessage(clientMsgId, text);
         chatInput.value = "";
     }
 });
@@ -57,27 +99,151 @@ chatInput.addEventListener("keydown", (e) => {
     }
 });
 
-ws.onmessage = (event) => {
-    const data = JSON.parse(event.data);
-    addMessage(data.message, data.sender);
-};
+// 受信済みIDを更新
+function updateLastMessageId(id) {
+    if (lastMessageId === null || id > lastMessageId) {
+        lastMessageId = id;
+    }
+}
+
+// WebSocket接続（再接続時は受信済みIDを渡して差分を受け取る）
+function connect() {
+    const url = lastMessageId === null ? wsUrl : wsUrl + "?last_id=" + lastMessageId;
+    ws = new WebSocket(url);
+
+    ws.onopen = () => {
+        reconnectDelay = 1000;
+        // 登録を確認できていないメッセージを再送（サーバ側で重複は除かれる）
+        outbox.forEach((text, clientMsgId) => sendMessage(clientMsgId, text));
+    };
+
+    ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+
+        if (data.type === "ping") {
+            // 死活監視への応答
+            ws.send(JSON.stringify({ type: "pong" }));
+            return;
+        }
+
+        if (data.type === "sync") {
+            updateLastMessageId(data.last_id);
+            // 登録が完了したメッセージは再送しない
+            (data.client_msg_ids || []).forEach((clientMsgId) => outbox.delete(clientMsgId));
+            return;
+        }
+
+        if (data.type === "error") {
+            // 送信が拒否されたメッセージは再送しない
+            if (data.client_msg_id) {
+                outbox.delete(data.client_msg_id);
+            }
+            disp_alert(sendErrorMessages[data.reason] || "メッセージを送信できませんでした。", "div_message_area");
+            return;
+        }
+
+        if (data.type === "reset") {
+            // 差分が多すぎる場合は履歴を読み込み直す
+            chatMessages.innerHTML = "";
+            seenClientIds.clear();
+            oldestMessageId = null;
+            lastMessageId = null;
+            ws.onclose = null;
+            ws.close();
+            page_init();
+            return;
+        }
+
+        if (data.id) {
+            // 登録済みのメッセージ（再接続時の差分送信）は再送しない
+            updateLastMessageId(data.id);
+            if (data.client_msg_id) {
+                outbox.delete(data.client_msg_id);
+            }
+        }
+        if (data.client_msg_id) {
+            if (seenClientIds.has(data.client_msg_id)) {
+                return;
+            }
+            seenClientIds.add(data.client_msg_id);
+        }
+        addMessage(data.message, data.sender);
+    };
+
+    ws.onclose = () => {
+        setTimeout(connect, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    };
+}
 
 // ページロード
 function page_init(){
 
+    // 最新のメッセージのみ取得
     fetch("/chat/" + room_id + "/api")
     .then(res => res.json())
     .then(data => {
         loadMessage(data.messages);
+        hasMoreHistory = data.has_more;
+        // 読み込んだ履歴より後のメッセージを受け取れるように接続
+        if (lastMessageId === null) {
+            lastMessageId = 0;
+        }
+        connect();
     });
-    
 
 }
 
-// 既存登録メンバーをロード
+// 既存登録メッセージをロード
 function loadMessage(messageData) {
-    console.log(messageData)
     messageData.forEach(msg => {
-        addMessage(msg.message, msg.user.user_name);
+        addMessage(msg.message, msg.user_name);
+        if (msg.client_msg_id) {
+            seenClientIds.add(msg.client_msg_id);
+        }
+        updateLastMessageId(msg.id);
+    });
+    if (messageData.length > 0) {
+        oldestMessageId = messageData[0].id;
+    }
+}
+
+// 過去のメッセージをロード（先頭に追加し、スクロール位置を維持する）
+function loadOlderMessage() {
+
+    if (!hasMoreHistory || isLoadingHistory || oldestMessageId === null) {
+        return;
+    }
+    isLoadingHistory = true;
+
+    fetch("/chat/" + room_id + "/api?before_id=" + oldestMessageId)
+    .then(res => res.json())
+    .then(data => {
+        const prevHeight = chatMessages.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(msg => {
+            fragment.appendChild(createMessage(msg.message, msg.user_name));
+            if (msg.client_msg_id) {
+                seenClientIds.add(msg.client_msg_id);
+            }
+        });
+        chatMessages.insertBefore(fragment, chatMessages.firstChild);
+        chatMessages.scrollTop = chatMessages.scrollHeight - prevHeight;
+
+        if (data.messages.length > 0) {
+            oldestMessageId = data.messages[0].id;
+        }
+        hasMoreHistory = data.has_more;
+    })
+    .finally(() => {
+        isLoadingHistory = false;
     });
-}
\ No newline at end of file
+
+}
+
+// 一番上までスクロールしたら過去のメッセージを読み込む
+chatMessages.addEventListener("scroll", () => {
+    if (chatMessages.scrollTop === 0) {
+        loadOlderMessage();
+    }
+});
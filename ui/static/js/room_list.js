@@ -22,10 +22,12 @@ function clear_onclick() {
 
 // 検索ボタン押下時
 // 検索処理実施
-function get_search_list(page_no) {
+// cursor: 前後のページへ移動する場合のカーソル（ページ番号指定・検索時は省略）
+function get_search_list(page_no, cursor = "") {
 
     // Hiddenへページ番号を設定
     document.getElementById("hdn_page_no").value = page_no;
+    document.getElementById("hdn_cursor").value = cursor;
 
     // 検索条件をCookieへ設定
     set_search_cookie();
@@ -41,6 +43,7 @@ function set_search_cookie() {
 
     document.cookie = "txt_room_name=" + encodeURIComponent(document.getElementById("txt_room_name").value);
     document.cookie = "hdn_page_no=" + document.getElementById("hdn_page_no").value;
+    document.cookie = "hdn_cursor=" + document.getElementById("hdn_cursor").value;
     document.cookie = "sel_row_max=" + document.getElementById("sel_row_max").value;
 
 }
@@ -50,6 +53,7 @@ function set_search_clear() {
 
     document.getElementById("txt_room_name").value = "";
     document.getElementById("hdn_page_no").value = 1;
+    document.getElementById("hdn_cursor").value = "";
 
 }
 
@@ -34,10 +34,12 @@ function download_onclick() {
 
 // 検索ボタン押下時
 // 検索処理実施
-function get_search_list(page_no) {
+// cursor: 前後のページへ移動する場合のカーソル（ページ番号指定・検索時は省略）
+function get_search_list(page_no, cursor = "") {
 
     // Hiddenへページ番号を設定
     document.getElementById("hdn_page_no").value = page_no;
+    document.getElementById("hdn_cursor").value = cursor;
 
     // 検索条件をCookieへ設定
     set_search_cookie();
@@ -54,6 +56,7 @@ function set_search_cookie() {
     document.cookie = "txt_mail_address=" + encodeURIComponent(document.getElementById("txt_mail_address").value);
     document.cookie = "txt_user_name=" + encodeURIComponent(document.getElementById("txt_user_name").value);
     document.cookie = "hdn_page_no=" + document.getElementById("hdn_page_no").value;
+    document.cookie = "hdn_cursor=" + document.getElementById("hdn_cursor").value;
     document.cookie = "sel_row_max=" + document.getElementById("sel_row_max").value;
 
 }
@@ -64,6 +67,7 @@ function set_search_clear() {
     document.getElementById("txt_mail_address").value = "";
     document.getElementById("txt_user_name").value = "";
     document.getElementById("hdn_page_no").value = 1;
+    document.getElementById("hdn_cursor").value = "";
 
 }
 